@@ -0,0 +1,24 @@
+"""算法签名的耗时基准，在仓库根目录执行：python -m benchmarks.bench_sign"""
+import timeit
+
+from src.xhs.help import b64Encode, mrc, sign
+
+URI = "/api/sns/web/v1/search/notes"
+DATA = {"keyword": "小红书", "page": 1, "page_size": 20, "search_id": "2c7hu5b3kzoivkh848hp0", "sort": "general"}
+A1 = "187d2defea8dz1fgwydnci40kw265ikh9fsxn66qs50000726043"
+
+
+def main(number: int = 20000):
+    cases = {
+        "sign(GET)": lambda: sign(URI, a1=A1),
+        "sign(POST)": lambda: sign(URI, DATA, a1=A1),
+        "mrc": lambda: mrc("1672145354635" + "1lcis2OJsjApO2qB1i5Lsl9p0jqBOjAbZjMKZ6s+Zgs3"),
+        "b64Encode(512B)": lambda: b64Encode(bytes(range(256)) * 2),
+    }
+    for name, func in cases.items():
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        print(f"{name:<18} {best / number * 1e6:8.2f} µs/次")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,188 @@ import requests
 from io import BytesIO
 import base64
 import os
+import tempfile
+import threading
+from .checkpoint import TaskCheckpoint, task_checkpoint_key
+from .distributed_limit import DistributedLimiter
+from .media_cache import MediaCache
+from .video_frame import FFMPEG_PATH, extract_video_frame
+
+# 流式上传时，长度未知的源文件超过多少字节后转存到临时文件
+UPLOAD_SPOOL_THRESHOLD = int(os.environ.get("UPLOAD_SPOOL_THRESHOLD", 8 * 1024 * 1024))
+# 流式读取源文件时每次读取的字节数
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# 本地素材缓存的大小上限（MB），默认 0 不使用缓存；缓存期间源地址上的文件更新了也不会重新下载，需要确认素材链接不会原地更新再开启
+MEDIA_CACHE_SIZE_MB = int(os.environ.get("MEDIA_CACHE_SIZE_MB", 0))
+REDIS_URL = os.environ.get("REDIS_URL")
+
+_media_cache = None
+_media_cache_lock = threading.Lock()
+_redis_client = None
+_redis_client_lock = threading.Lock()
+_distributed_limiter = None
+
+
+def get_redis_client():
+    """进程内共享的 Redis 客户端，使用 worker 的 REDIS_URL，未配置时返回 None"""
+    global _redis_client
+    if not REDIS_URL:
+        return None
+    with _redis_client_lock:
+        if _redis_client is None:
+            # redis 随 vines-worker-sdk 一起安装，单独使用 src.xhs 时不需要
+            import redis
+            _redis_client = redis.Redis.from_url(REDIS_URL)
+        return _redis_client
+
+
+def get_task_checkpoint(task: dict):
+    """Conductor 任务的检查点，未配置 REDIS_URL 或任务没有 id 时返回 None"""
+    redis_client = get_redis_client()
+    key = task_checkpoint_key(task)
+    if redis_client is None or key is None:
+        return None
+    return TaskCheckpoint(redis_client, key)
+
+
+def get_distributed_limiter():
+    """所有 worker 节点共享的分布式限额，未配置 REDIS_URL 时返回 None"""
+    global _distributed_limiter
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return None
+    with _redis_client_lock:
+        if _distributed_limiter is None:
+            _distributed_limiter = DistributedLimiter(redis_client)
+        return _distributed_limiter
+
+
+def get_media_cache():
+    """进程内共享的素材缓存，未开启时返回 None"""
+    global _media_cache
+    if MEDIA_CACHE_SIZE_MB <= 0:
+        return None
+    with _media_cache_lock:
+        if _media_cache is None:
+            folder = os.path.join(get_and_ensure_exists_tmp_files_folder(), "media-cache")
+            _media_cache = MediaCache(folder, MEDIA_CACHE_SIZE_MB * 1024 * 1024)
+        return _media_cache
 
 
 def download_image(url: str):
+    """下载图片，源地址返回错误状态码时抛出 requests.HTTPError"""
+    media_cache = get_media_cache()
+    if media_cache is not None:
+        return BytesIO(media_cache.read(url))
     response = requests.get(url)
+    response.raise_for_status()
     image_data = BytesIO(response.content)
     return image_data
 
 
+class UploadStream:
+    """长度已知的只读流，可以直接作为 requests 的请求体，requests 会带上 Content-Length 并按块读取发送"""
+
+    def __init__(self, fileobj, length: int, closeables=()):
+        self._fileobj = fileobj
+        self._length = length
+        self._closeables = closeables
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        return self._fileobj.read(size)
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        for closeable in self._closeables:
+            closeable.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_file_stream(path: str) -> UploadStream:
+    f = open(path, "rb")
+    return UploadStream(f, os.fstat(f.fileno()).st_size, closeables=(f,))
+
+
+class CachingReader:
+    """读取源地址响应流的同时写入素材缓存，完整读完后才放进缓存，中途关闭时丢弃"""
+
+    def __init__(self, response: requests.Response, length: int, writer):
+        self._response = response
+        self._length = length
+        self._writer = writer
+        self._done = False
+
+    def read(self, size=-1):
+        chunk = self._response.raw.read(size)
+        if self._done:
+            return chunk
+        self._writer.write(chunk)
+        if self._writer.size >= self._length:
+            self._done = True
+            try:
+                self._writer.commit()
+            except OSError as e:
+                print(f"写入素材缓存失败：{e}")
+        return chunk
+
+    def close(self):
+        if not self._done:
+            self._done = True
+            self._writer.discard()
+        self._response.close()
+
+
+def open_upload_stream(url: str, spool_threshold: int = UPLOAD_SPOOL_THRESHOLD) -> UploadStream:
+    """打开源文件的流，不把整个文件读入内存
+
+    已经在素材缓存中的直接读取本地文件；源地址返回了 Content-Length 时直接把响应流接到上传请求上，
+    大小不超过缓存上限四分之一的同时写入缓存，便于其他账号复用；长度未知时先写入 SpooledTemporaryFile，
+    小于 spool_threshold 的留在内存中，超过后自动转存到临时文件。
+    """
+    media_cache = get_media_cache()
+    if media_cache is not None:
+        cached = media_cache.get(url)
+        if cached is not None:
+            return open_file_stream(cached[0])
+
+    response = requests.get(url, stream=True)
+    response.raise_for_status()
+    length = response.headers.get("Content-Length")
+    encoding = response.headers.get("Content-Encoding", "identity")
+    if length is not None and encoding == "identity":
+        length = int(length)
+        if media_cache is not None and length <= media_cache.max_size // 4:
+            reader = CachingReader(response, length, media_cache.writer(url))
+            return UploadStream(reader, length, closeables=(reader,))
+        return UploadStream(response.raw, length, closeables=(response,))
+
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_threshold, dir=get_and_ensure_exists_tmp_files_folder())
+    try:
+        with response:
+            for chunk in response.iter_content(UPLOAD_CHUNK_SIZE):
+                spool.write(chunk)
+        length = spool.tell()
+        spool.seek(0)
+    except Exception:
+        spool.close()
+        raise
+    return UploadStream(spool, length, closeables=(spool,))
+
+
 def save_bytes_to_image(bytes_data, file_path):
     with open(file_path, 'wb') as file:
         file.write(bytes_data)
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+
+# 任务检查点保存多少秒，需要覆盖 Conductor 的重试间隔
+TASK_CHECKPOINT_TTL = int(os.environ.get("TASK_CHECKPOINT_TTL", 24 * 3600))
+
+
+def task_input_hash(task: dict):
+    """任务输入参数的摘要，参数变化后旧的检查点不再适用"""
+    input_data = json.dumps(task.get("inputData") or {}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(input_data.encode("utf-8")).hexdigest()[:16]
+
+
+def task_checkpoint_key(task: dict):
+    """同一个任务重试时 taskId 会变，workflowInstanceId + referenceTaskName 不变，优先使用后者
+
+    key 中带上 inputData 的摘要，重跑时修改了参数（换了图片、标题等）不会复用上一次的检查点。
+    """
+    input_hash = task_input_hash(task)
+    workflow_instance_id = task.get("workflowInstanceId")
+    reference_task_name = task.get("referenceTaskName")
+    if workflow_instance_id and reference_task_name:
+        return f"checkpoint:{workflow_instance_id}:{reference_task_name}:{input_hash}"
+    task_id = task.get("taskId")
+    if task_id:
+        return f"checkpoint:{task_id}:{input_hash}"
+    return None
+
+
+class TaskCheckpoint:
+    """单个任务各阶段的结果，保存在 Redis 的一个 hash 中
+
+    任务失败后重试时，已经完成的阶段（上传的文件 id、话题搜索结果、视频 id 等）直接从检查点读取，不再重复执行。
+    Redis 不可用时不保存，任务照常从头执行。
+    """
+
+    def __init__(self, redis_client, key: str, ttl: int = TASK_CHECKPOINT_TTL):
+        self.redis_client = redis_client
+        self.key = key
+        self.ttl = ttl
+
+    def get(self, stage: str):
+        """返回阶段结果，没有保存过时返回 None"""
+        try:
+            value = self.redis_client.hget(self.key, stage)
+        except Exception as e:
+            print(f"读取任务检查点失败：{e}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    def set(self, stage: str, value):
+        try:
+            pipeline = self.redis_client.pipeline()
+            pipeline.hset(self.key, stage, json.dumps(value, ensure_ascii=False))
+            pipeline.expire(self.key, self.ttl)
+            pipeline.execute()
+        except Exception as e:
+            print(f"保存任务检查点失败：{e}")
+
+    def clear(self):
+        try:
+            self.redis_client.delete(self.key)
+        except Exception as e:
+            print(f"删除任务检查点失败：{e}")
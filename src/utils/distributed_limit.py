@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from typing import NamedTuple
+
+# 每个小红书账号每小时最多发布多少篇笔记
+XHS_PUBLISH_PER_HOUR = int(os.environ.get("XHS_PUBLISH_PER_HOUR", 20))
+# 每个小红书账号每秒最多发出多少个签名请求
+XHS_SIGNED_PER_SECOND = int(os.environ.get("XHS_SIGNED_PER_SECOND", 3))
+# 签名请求额度的计数窗口（秒），窗口越长，每次从 Redis 预取的额度越能用完
+XHS_SIGNED_WINDOW = int(os.environ.get("XHS_SIGNED_WINDOW", 10))
+# 每次从 Redis 预取多少个签名请求额度，节点在本地用完后才再次访问 Redis
+XHS_SIGNED_LEASE = int(os.environ.get("XHS_SIGNED_LEASE", 5))
+# 读取类接口每个账号每分钟的额度，按接口路径区分，未列出的接口只受签名请求额度限制
+XHS_READ_PER_MINUTE = {
+    "/api/sns/web/v1/feed": 60,
+    "/api/sns/web/v1/search/notes": 30,
+    "/api/sns/web/v1/user_posted": 30,
+    "/api/sns/web/v1/user/otherinfo": 30,
+    "/api/sns/web/v2/comment/page": 60,
+    "/api/sns/web/v2/comment/sub/page": 60,
+    "/web_api/sns/v1/search/topic": 60,
+    "/web_api/sns/v1/search/user_info": 60,
+}
+# 每次从 Redis 预取多少个读取额度
+XHS_READ_LEASE = int(os.environ.get("XHS_READ_LEASE", 5))
+# 每个 Instagram 账号每小时最多发布多少个帖子
+INSTAGRAM_PUBLISH_PER_HOUR = int(os.environ.get("INSTAGRAM_PUBLISH_PER_HOUR", 10))
+
+# 在当前窗口内申请 grant 个额度，返回实际申请到的数量
+LEASE_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local grant = math.min(tonumber(ARGV[2]), tonumber(ARGV[1]) - current)
+if grant <= 0 then
+    return 0
+end
+redis.call('INCRBY', KEYS[1], grant)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return grant
+"""
+
+
+class Budget(NamedTuple):
+    # 每个窗口内的额度
+    limit: int
+    # 窗口长度（秒）
+    window: float
+    # 每次从 Redis 预取多少个额度在本地使用，减少访问 Redis 的次数
+    lease: int = 1
+
+
+_signed_limit = XHS_SIGNED_PER_SECOND * XHS_SIGNED_WINDOW
+
+DEFAULT_BUDGETS = {
+    "xhs:publish": Budget(XHS_PUBLISH_PER_HOUR, 3600),
+    "xhs:signed": Budget(_signed_limit, XHS_SIGNED_WINDOW, lease=max(1, min(XHS_SIGNED_LEASE, _signed_limit))),
+    "instagram:publish": Budget(INSTAGRAM_PUBLISH_PER_HOUR, 3600),
+}
+# 读取类接口的额度名称为 xhs:read:<接口路径>
+DEFAULT_BUDGETS.update({
+    f"xhs:read:{path}": Budget(limit, 60, lease=max(1, min(XHS_READ_LEASE, limit)))
+    for path, limit in XHS_READ_PER_MINUTE.items()
+})
+
+
+class RateLimitExceeded(Exception):
+    """额度已用完，并且下一个窗口开始前超过了允许等待的时间"""
+
+
+class DistributedLimiter:
+    """通过 Redis 在所有 worker 节点之间共享的限额
+
+    每个 (额度名称, 账号) 按固定时间窗口计数，申请额度使用 Lua 脚本原子完成；
+    每次可以预取 Budget.lease 个额度在本地使用，当前窗口结束时作废，热点路径不需要每次访问 Redis。
+    Redis 不可用时放行，不影响正常发布。
+    """
+
+    def __init__(self, redis_client, budgets: dict = None, key_prefix: str = "ratelimit:"):
+        """
+        :param redis_client: redis.Redis
+        :param budgets: 可选，{额度名称: Budget}，默认使用 DEFAULT_BUDGETS
+        :param key_prefix: Redis key 前缀
+        """
+        self.redis_client = redis_client
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self.key_prefix = key_prefix
+        self._script = redis_client.register_script(LEASE_SCRIPT)
+        # {(name, subject): [窗口序号, 剩余额度]}
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def _take_local(self, lease_key: tuple, window_index: int) -> bool:
+        with self._lock:
+            lease = self._leases.get(lease_key)
+            if lease is not None and lease[0] == window_index and lease[1] > 0:
+                lease[1] -= 1
+                return True
+            return False
+
+    def _lease(self, name: str, subject: str, budget: Budget, window_index: int) -> int:
+        key = f"{self.key_prefix}{name}:{subject}:{window_index}"
+        return int(self._script(keys=[key], args=[budget.limit, budget.lease, int(budget.window) + 1]))
+
+    def acquire(self, name: str, subject: str, max_wait: float = 0) -> float:
+        """申请一个额度，当前窗口额度用完时等待下一个窗口，返回等待的秒数
+
+        :param name: 额度名称，例如 xhs:publish
+        :param subject: 账号标识
+        :param max_wait: 最多等待多少秒，下一个窗口开始得更晚时抛出 RateLimitExceeded
+        """
+        budget = self.budgets.get(name)
+        if budget is None:
+            return 0
+        lease_key = (name, subject)
+        started = time.time()
+        while True:
+            now = time.time()
+            window_index = int(now // budget.window)
+            if self._take_local(lease_key, window_index):
+                return now - started
+            try:
+                granted = self._lease(name, subject, budget, window_index)
+            except Exception as e:
+                print(f"申请分布式限额失败，本次放行：{e}")
+                return now - started
+            if granted > 0:
+                with self._lock:
+                    self._leases[lease_key] = [window_index, granted - 1]
+                return now - started
+            wait = (window_index + 1) * budget.window - now
+            if now + wait - started > max_wait:
+                raise RateLimitExceeded(
+                    f"超出限额 {name}：{subject} 每 {budget.window:g} 秒最多 {budget.limit} 次，{wait:.0f} 秒后可以重试"
+                )
+            time.sleep(wait)
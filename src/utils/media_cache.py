@@ -0,0 +1,261 @@
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+
+class MediaCache:
+    """按内容寻址的本地素材缓存
+
+    objects/<sha256> 存放文件内容，相同内容的不同链接只保存一份；urls/<sha256(url)> 记录链接对应的内容哈希。
+    所有写入都先写临时文件再原子替换，读取方拿到的总是完整的文件；淘汰时直接删除文件，
+    已经打开文件的读取方不受影响（POSIX 语义）。总大小超过预算时按最近访问时间淘汰。
+    """
+
+    def __init__(self, folder: str, max_size: int, url_ttl: float = 86400):
+        """
+        :param folder: 缓存目录
+        :param max_size: 缓存总大小上限（字节）
+        :param url_ttl: 链接到内容的映射有效期（秒），过期后重新下载以发现源文件的变化
+        """
+        self.folder = folder
+        self.max_size = max_size
+        self.url_ttl = url_ttl
+        self.objects_folder = os.path.join(folder, "objects")
+        self.urls_folder = os.path.join(folder, "urls")
+        self.tmp_folder = os.path.join(folder, "tmp")
+        for path in (self.objects_folder, self.urls_folder, self.tmp_folder):
+            os.makedirs(path, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.downloaded_bytes = 0
+        self._lock = threading.Lock()
+        self._url_locks = {}
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _object_path(self, content_hash: str) -> str:
+        return os.path.join(self.objects_folder, content_hash)
+
+    def _url_path(self, url: str) -> str:
+        return os.path.join(self.urls_folder, self._hash(url))
+
+    def tmp_path(self) -> str:
+        """缓存目录下的临时文件路径，与缓存在同一个文件系统中，写好后可以用 add_file 原子地放进缓存"""
+        return os.path.join(self.tmp_folder, f"{os.getpid()}-{threading.get_ident()}-{time.time_ns()}")
+
+    @contextmanager
+    def _url_lock(self, url: str):
+        """同一个链接的互斥锁，没有线程使用时从 _url_locks 中删除，长期运行的 worker 不会越积越多"""
+        key = self._hash(url)
+        with self._lock:
+            entry = self._url_locks.get(key)
+            if entry is None:
+                entry = self._url_locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._url_locks[key]
+
+    def lookup(self, url: str):
+        """命中时返回 (文件路径, 内容哈希)，否则返回 None，不计入命中统计"""
+        url_path = self._url_path(url)
+        try:
+            if time.time() - os.path.getmtime(url_path) > self.url_ttl:
+                return None
+            with open(url_path) as f:
+                content_hash = f.read().strip()
+            path = self._object_path(content_hash)
+            # 更新访问时间，用于 LRU 淘汰
+            os.utime(path)
+            return path, content_hash
+        except OSError:
+            return None
+
+    def get(self, url: str):
+        """命中时返回 (文件路径, 内容哈希) 并计入命中统计，否则返回 None"""
+        cached = self.lookup(url)
+        if cached is not None:
+            self._count(hit=True)
+        return cached
+
+    def fetch(self, url: str, response: requests.Response = None):
+        """返回 (文件路径, 内容哈希)，未命中时下载到缓存
+
+        :param response: 可选，已经以 stream=True 打开的源地址响应，未命中时直接从它读取内容
+        """
+        cached = self.get(url)
+        if cached is not None:
+            if response is not None:
+                response.close()
+            return cached
+        # 同一进程内同一个链接只下载一次，其余线程等待后直接命中
+        with self._url_lock(url):
+            cached = self.get(url)
+            if cached is not None:
+                if response is not None:
+                    response.close()
+                return cached
+            self._count(hit=False)
+            return self._download(url, response)
+
+    def read(self, url: str) -> bytes:
+        """返回链接的内容，未命中时下载，源地址返回错误状态码时抛出异常
+
+        超过缓存大小四分之一的文件不写入缓存，避免刚写入就被淘汰，直接返回下载的内容。
+        """
+        for _ in range(3):
+            cached = self.get(url)
+            if cached is None:
+                with self._url_lock(url):
+                    cached = self.get(url)
+                    if cached is None:
+                        self._count(hit=False)
+                        return self._download_bytes(url)
+            try:
+                with open(cached[0], "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                # 刚好被其他进程淘汰了，重新下载
+                continue
+        raise Exception(f"读取缓存素材失败：{url}")
+
+    def writer(self, url: str) -> "MediaCacheWriter":
+        """边读边写入缓存，读完后调用 commit() 写入缓存，中途失败时调用 discard()"""
+        return MediaCacheWriter(self, url)
+
+    def _download(self, url: str, response: requests.Response = None):
+        writer = self.writer(url)
+        try:
+            if response is None:
+                response = requests.get(url, stream=True)
+            with response:
+                response.raise_for_status()
+                for chunk in response.iter_content(64 * 1024):
+                    writer.write(chunk)
+        except Exception:
+            writer.discard()
+            raise
+        return writer.commit()
+
+    def _download_bytes(self, url: str) -> bytes:
+        response = requests.get(url)
+        response.raise_for_status()
+        data = response.content
+        if len(data) > self.max_size // 4:
+            with self._lock:
+                self.downloaded_bytes += len(data)
+            return data
+        writer = self.writer(url)
+        try:
+            writer.write(data)
+            writer.commit()
+        except Exception as e:
+            writer.discard()
+            print(f"写入素材缓存失败：{e}")
+        return data
+
+    def add_file(self, url: str, path: str):
+        """把 tmp_path() 下已经写好的文件移动到缓存中，返回 (文件路径, 内容哈希)"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return self._store(url, path, digest.hexdigest(), os.path.getsize(path))
+
+    def _store(self, url: str, tmp_path: str, content_hash: str, size: int):
+        path = self._object_path(content_hash)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self.downloaded_bytes += size
+
+        url_tmp_path = self.tmp_path()
+        with open(url_tmp_path, "w") as f:
+            f.write(content_hash)
+        os.replace(url_tmp_path, self._url_path(url))
+        self._enforce_budget()
+        return path, content_hash
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _enforce_budget(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.objects_folder):
+            path = os.path.join(self.objects_folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_size:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "downloaded_bytes": self.downloaded_bytes}
+
+
+class MediaCacheWriter:
+    """写入缓存的一个文件，内容先写到临时文件并同时计算哈希，commit 时再放到 objects 下并记录链接"""
+
+    def __init__(self, cache: MediaCache, url: str):
+        self.cache = cache
+        self.url = url
+        self.size = 0
+        self._tmp_path = cache.tmp_path()
+        self._file = open(self._tmp_path, "wb")
+        self._digest = hashlib.sha256()
+
+    def write(self, chunk: bytes):
+        self._digest.update(chunk)
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        """返回 (文件路径, 内容哈希)"""
+        try:
+            self._file.close()
+        except Exception:
+            self.discard()
+            raise
+        return self.cache._store(self.url, self._tmp_path, self._digest.hexdigest(), self.size)
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
@@ -0,0 +1,42 @@
+import os
+import shutil
+import subprocess
+from io import BytesIO
+
+from PIL import Image
+
+# ffmpeg 可执行文件路径，默认从 PATH 中查找，找不到时不能在本地截取视频帧
+FFMPEG_PATH = os.environ.get("FFMPEG_PATH") or shutil.which("ffmpeg")
+
+
+def extract_video_frame(source: str, ts: float = 0, timeout: float = 30, quality: int = 90):
+    """使用 ffmpeg 截取视频中的一帧，返回 JPEG 图片内容，没有 ffmpeg 或截取失败时返回 None
+
+    :param source: 视频链接或本地路径，链接由 ffmpeg 直接读取，mp4 只会下载截帧需要的部分
+    :param ts: 截取第几秒的画面，默认第一帧
+    :param timeout: ffmpeg 执行超时时间（秒）
+    :param quality: JPEG 质量
+    """
+    if not FFMPEG_PATH:
+        return None
+    command = [
+        FFMPEG_PATH, "-v", "error", "-ss", str(ts), "-i", source,
+        "-frames:v", "1", "-f", "image2pipe", "-vcodec", "png", "-",
+    ]
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"截取视频帧失败：{e}")
+        return None
+    if result.returncode != 0 or not result.stdout:
+        print(f"截取视频帧失败：{result.stderr.decode('utf-8', 'ignore').strip()}")
+        return None
+    # 统一转成 JPEG，与其他图片的上传格式一致
+    output = BytesIO()
+    try:
+        with Image.open(BytesIO(result.stdout)) as image:
+            image.convert("RGB").save(output, format="JPEG", quality=quality)
+    except OSError as e:
+        print(f"视频帧转换为 JPEG 失败：{e}")
+        return None
+    return output.getvalue()
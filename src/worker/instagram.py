@@ -3,11 +3,14 @@ from pathlib import Path
 from vines_worker_sdk.conductor.worker import Worker
 from instagrapi import Client
 from src.logger import logger
-from src.utils import download_image, base64_to_bytes, get_and_ensure_exists_tmp_files_folder, save_bytes_to_image
+from src.utils import download_image, base64_to_bytes, get_and_ensure_exists_tmp_files_folder, save_bytes_to_image, \
+    get_distributed_limiter, get_task_checkpoint
 import uuid
 import json
 
 PROXY_URL = os.environ.get("PROXY_URL")
+# 所有 worker 节点共享每个账号的发布限额
+distributed_limiter = get_distributed_limiter()
 
 
 class InstagramWorker(Worker):
@@ -175,6 +178,13 @@ class InstagramWorker(Worker):
         username = credential_data.get('username')
         password = credential_data.get('password')
 
+        # 任务重试时，已经发布成功的直接返回结果
+        checkpoint = get_task_checkpoint(task)
+        media_result = checkpoint.get("media") if checkpoint is not None else None
+        if media_result is not None:
+            logger.info("任务已经发布成功，直接返回检查点中的结果")
+            return media_result
+
         if PROXY_URL:
             print(f"使用代理 {PROXY_URL} 访问 Instagram")
 
@@ -220,6 +230,12 @@ class InstagramWorker(Worker):
         like_and_view_counts_disabled = input_data.get("like_and_view_counts_disabled", False)
         disable_comments = input_data.get("disable_comments", False)
 
+        # 发布额度只在真正发布前占用，检查点记录已占用，任务重试时不再重复扣减
+        if distributed_limiter is not None and (checkpoint is None or not checkpoint.get("publish_budget")):
+            distributed_limiter.acquire("instagram:publish", username)
+            if checkpoint is not None:
+                checkpoint.set("publish_budget", True)
+
         try:
             media = cl.photo_upload(
                 file_path,
@@ -233,7 +249,10 @@ class InstagramWorker(Worker):
 
             logger.info(f"上传图片成功：{media}")
             result_str = media.json()
-            return json.loads(result_str)
+            media_result = json.loads(result_str)
+            if checkpoint is not None:
+                checkpoint.set("media", media_result)
+            return media_result
         except Exception as e:
             err_msg = f"发布失败：{str(e)}"
             if 'Request processing failed' in err_msg:
@@ -1,9 +1,30 @@
 import re
 from vines_worker_sdk.conductor.worker import Worker
-from src.xhs.sign import sign
-from src.xhs.core import XhsClient
+from src.xhs.sign import get_signer
+from src.xhs.sign_client import RemoteSigner, SIGN_SERVER_URL
+from src.xhs.sign_strategy import AdaptiveSignStrategy, LOCAL_SIGN_ENDPOINTS
+from src.xhs.registry import XhsClientRegistry
+from src.xhs.upload_index import UploadDedupIndex
+from src.xhs.cache import SharedCache
+from src.utils import get_distributed_limiter, get_redis_client, get_task_checkpoint
 from src.xhs.utils import beauty_print
 
+# 配置了 XHS_SIGN_SERVER_URL 时使用本机共享的签名服务，否则在当前进程内启动浏览器签名
+signer = RemoteSigner() if SIGN_SERVER_URL else get_signer()
+# 在所有任务之间共享，按接口统计算法签名的成功率；只有确认接受算法签名的创作者、上传接口尝试算法签名，其余接口直接走浏览器
+sign_strategy = AdaptiveSignStrategy(endpoints=LOCAL_SIGN_ENDPOINTS)
+redis_client = get_redis_client()
+# 同一账号重复发布的素材复用已上传的文件 id，记录通过 Redis 在 worker 之间共享
+upload_index = UploadDedupIndex(redis_client=redis_client)
+# 话题、推荐 @ 用户的搜索结果与账号无关，通过 Redis 在所有 worker 之间共享
+shared_cache = SharedCache(redis_client) if redis_client is not None else None
+# 同一账号的任务复用客户端及其 keep-alive 连接
+# 所有 worker 节点共享每个账号的签名请求和发布限额
+xhs_clients = XhsClientRegistry(
+    sign=signer, sign_strategy=sign_strategy, upload_index=upload_index, cache=shared_cache,
+    distributed_limiter=get_distributed_limiter(),
+)
+
 
 class XiaohongshuWorker(Worker):
     block_name = 'xiaohongshu'
@@ -134,6 +155,11 @@ class XiaohongshuWorker(Worker):
                 "displayName": "链接",
                 "type": "string",
             },
+            {
+                "name": "timings",
+                "displayName": "各阶段耗时（秒）",
+                "type": "json",
+            },
         ],
         "credentials": [
             {
@@ -188,7 +214,9 @@ class XiaohongshuWorker(Worker):
         topics = list(set(topics))
         print("topics: ", topics)
 
-        xhs_client = XhsClient(cookie, sign=sign)
+        xhs_client = xhs_clients.get(cookie)
+        # 任务重试时从上次完成的阶段继续，不再重复上传
+        checkpoint = get_task_checkpoint(task)
         result = None
         if note_type == 'image':
             result = xhs_client.create_image_note(
@@ -198,7 +226,8 @@ class XiaohongshuWorker(Worker):
                 is_private=is_private,
                 topics=topics,
                 post_time=post_time,
-                ats=ats
+                ats=ats,
+                checkpoint=checkpoint
             )
         elif note_type == 'video':
             result = xhs_client.create_video_note(
@@ -209,7 +238,8 @@ class XiaohongshuWorker(Worker):
                 topics=topics,
                 post_time=post_time,
                 ats=ats,
-                cover_path=video_cover_url
+                cover_path=video_cover_url,
+                checkpoint=checkpoint
             )
         beauty_print(result)
         id, score = result['id'], result['score']
@@ -217,5 +247,6 @@ class XiaohongshuWorker(Worker):
         return {
             "id": id,
             "score": score,
-            "link": link
+            "link": link,
+            "timings": result.get("timings", {})
         }
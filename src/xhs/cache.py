@@ -0,0 +1,304 @@
+import json
+import os
+import threading
+import uuid
+import time
+from collections import OrderedDict
+
+# 话题搜索结果的缓存时间（秒）
+TOPIC_CACHE_TTL = float(os.environ.get("XHS_TOPIC_CACHE_TTL", 6 * 3600))
+# 没有搜索到的话题的缓存时间（秒），比正常结果短，新建的话题可以较快生效
+TOPIC_NEGATIVE_TTL = float(os.environ.get("XHS_TOPIC_NEGATIVE_TTL", 600))
+# 推荐话题、推荐 @ 用户搜索结果的缓存时间（秒）
+SUGGEST_CACHE_TTL = float(os.environ.get("XHS_SUGGEST_CACHE_TTL", 3600))
+# 进程内最多缓存多少个 key
+TOPIC_CACHE_SIZE = int(os.environ.get("XHS_TOPIC_CACHE_SIZE", 4096))
+# 共享缓存在进程内的缓存时间（秒），过期后重新读取 Redis
+SHARED_CACHE_LOCAL_TTL = float(os.environ.get("XHS_SHARED_CACHE_LOCAL_TTL", 60))
+# 共享缓存过期后，在这段时间（秒）内其他节点刷新期间仍然返回旧值
+SHARED_CACHE_STALE_TTL = float(os.environ.get("XHS_SHARED_CACHE_STALE_TTL", 3600))
+
+
+class TTLCache:
+    """带过期时间的进程内缓存，线程安全
+
+    值为 None 表示查询过但没有结果（负缓存），使用较短的 negative_ttl；
+    get_or_load 对同一个 key 只会同时执行一次 loader，其余线程等待结果。
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float = None, max_size: int = 4096):
+        """
+        :param ttl: 缓存时间（秒）
+        :param negative_ttl: 可选，值为 None 时的缓存时间（秒），默认同 ttl
+        :param max_size: 最多缓存多少个 key，超出后淘汰最久未使用的
+        """
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    def lookup(self, key):
+        """返回 (是否命中, 值)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def __contains__(self, key):
+        return self.lookup(key)[0]
+
+    def set(self, key, value, ttl: float = None, negative_ttl: float = None):
+        if value is None:
+            ttl = self.negative_ttl if negative_ttl is None else negative_ttl
+        elif ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_or_load(self, key, loader, ttl: float = None, negative_ttl: float = None):
+        """命中时直接返回缓存的值，否则调用 loader() 并缓存结果，loader 抛出的异常不缓存
+
+        :param ttl: 可选，这个 key 的缓存时间，默认使用 self.ttl
+        :param negative_ttl: 可选，loader 返回 None 时的缓存时间，默认使用 self.negative_ttl
+        """
+        hit, value = self.lookup(key)
+        if hit:
+            self._count(hit=True)
+            return value
+        with self._lock:
+            lock = self._loading.setdefault(key, threading.Lock())
+        with lock:
+            hit, value = self.lookup(key)
+            if hit:
+                self._count(hit=True)
+                return value
+            self._count(hit=False)
+            try:
+                value = loader()
+                self.set(key, value, ttl, negative_ttl)
+                return value
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class SharedCache:
+    """多个 worker 节点共享的缓存，Redis 作为二级缓存，进程内的 TTLCache 作为一级缓存
+
+    Redis 中的值带有逻辑过期时间，key 本身多保留 stale_ttl 秒：
+    逻辑过期后由抢到刷新锁（SET NX）的节点重新加载，其他节点在此期间继续返回旧值；
+    完全没有缓存时，没抢到锁的节点等待刷新结果，超过 wait_timeout 后自己加载。
+    Redis 不可用时退化为只使用进程内缓存。接口与 TTLCache 相同，可以直接作为 XhsClient 的 cache 参数。
+    """
+
+    def __init__(
+            self,
+            redis_client,
+            key_prefix: str = "xhs:cache:",
+            ttl: float = TOPIC_CACHE_TTL,
+            negative_ttl: float = TOPIC_NEGATIVE_TTL,
+            local_ttl: float = SHARED_CACHE_LOCAL_TTL,
+            stale_ttl: float = SHARED_CACHE_STALE_TTL,
+            lock_ttl: float = 30,
+            wait_timeout: float = 10,
+            max_size: int = TOPIC_CACHE_SIZE,
+    ):
+        """
+        :param redis_client: redis.Redis
+        :param key_prefix: Redis key 前缀
+        :param ttl: 默认缓存时间（秒）
+        :param negative_ttl: 值为 None 时的默认缓存时间（秒）
+        :param local_ttl: 进程内缓存时间（秒）
+        :param stale_ttl: 逻辑过期后继续保留旧值的时间（秒）
+        :param lock_ttl: 刷新锁的有效期（秒），持有锁的节点异常退出后锁自动释放
+        :param wait_timeout: 没有旧值可用时等待其他节点刷新的最长时间（秒）
+        """
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.local = TTLCache(local_ttl, min(local_ttl, negative_ttl), max_size)
+        self.shared_hits = 0
+        self.stale_hits = 0
+        self.loads = 0
+        self._lock = threading.Lock()
+
+    def _key(self, key) -> str:
+        return f"{self.key_prefix}{key}"
+
+    def _read(self, key):
+        """返回 (是否存在, 值, 是否已逻辑过期)"""
+        raw = self.redis_client.get(self._key(key))
+        if raw is None:
+            return False, None, False
+        entry = json.loads(raw)
+        return True, entry["value"], entry["expire_at"] <= time.time()
+
+    def _write(self, key, value, ttl: float):
+        entry = json.dumps({"value": value, "expire_at": time.time() + ttl}, ensure_ascii=False)
+        self.redis_client.set(self._key(key), entry, ex=int(ttl + self.stale_ttl))
+
+    def _try_lock(self, key):
+        token = uuid.uuid4().hex
+        if self.redis_client.set(self._key(f"lock:{key}"), token, nx=True, ex=int(self.lock_ttl)):
+            return token
+        return None
+
+    def _unlock(self, key, token: str):
+        lock_key = self._key(f"lock:{key}")
+        try:
+            if self.redis_client.get(lock_key) == token.encode("utf-8"):
+                self.redis_client.delete(lock_key)
+        except Exception as e:
+            print(f"释放缓存刷新锁失败：{e}")
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _load(self, key, loader, ttls: tuple, token: str):
+        self._count("loads")
+        try:
+            value = loader()
+            try:
+                self._write(key, value, ttls[0] if value is not None else ttls[1])
+            except Exception as e:
+                print(f"写入共享缓存失败：{e}")
+            return value
+        finally:
+            if token is not None:
+                self._unlock(key, token)
+
+    def _get_shared(self, key, loader, ttls: tuple):
+        try:
+            found, value, stale = self._read(key)
+        except Exception as e:
+            print(f"读取共享缓存失败，直接加载：{e}")
+            self._count("loads")
+            return loader()
+        if found and not stale:
+            self._count("shared_hits")
+            return value
+        try:
+            token = self._try_lock(key)
+        except Exception as e:
+            print(f"获取缓存刷新锁失败，直接加载：{e}")
+            token = None
+            if found:
+                return self._load(key, loader, ttls, None)
+        if token is not None:
+            return self._load(key, loader, ttls, token)
+        if found:
+            # 其他节点正在刷新，先返回旧值
+            self._count("stale_hits")
+            return value
+
+        deadline = time.time() + self.wait_timeout
+        while time.time() < deadline:
+            time.sleep(0.1)
+            try:
+                found, value, _ = self._read(key)
+            except Exception:
+                break
+            if found:
+                self._count("shared_hits")
+                return value
+        return self._load(key, loader, ttls, None)
+
+    def lookup(self, key):
+        """返回 (是否命中, 值)，已逻辑过期的值视为未命中，Redis 中命中的值同时写入进程内缓存"""
+        hit, value = self.local.lookup(key)
+        if hit:
+            return hit, value
+        try:
+            found, value, stale = self._read(key)
+        except Exception:
+            return False, None
+        if not found or stale:
+            return False, None
+        self._count("shared_hits")
+        self.local.set(key, value)
+        return True, value
+
+    def __contains__(self, key):
+        return self.lookup(key)[0]
+
+    def set(self, key, value, ttl: float = None, negative_ttl: float = None):
+        if value is None:
+            ttl = self.negative_ttl if negative_ttl is None else negative_ttl
+        elif ttl is None:
+            ttl = self.ttl
+        self.local.set(key, value)
+        try:
+            self._write(key, value, ttl)
+        except Exception as e:
+            print(f"写入共享缓存失败：{e}")
+
+    def delete(self, key):
+        self.local.delete(key)
+        try:
+            self.redis_client.delete(self._key(key))
+        except Exception as e:
+            print(f"删除共享缓存失败：{e}")
+
+    def get_or_load(self, key, loader, ttl: float = None, negative_ttl: float = None):
+        """先查进程内缓存，再查 Redis，都没有时调用 loader() 并写入两级缓存
+
+        :param ttl: 可选，这个 key 在 Redis 中的缓存时间，默认使用 self.ttl
+        :param negative_ttl: 可选，loader 返回 None 时在 Redis 中的缓存时间，默认使用 self.negative_ttl
+        """
+        ttls = (self.ttl if ttl is None else ttl, self.negative_ttl if negative_ttl is None else negative_ttl)
+
+        def load():
+            return self._get_shared(key, loader, ttls)
+
+        # 进程内的 get_or_load 保证同一个 key 在一个进程里只有一个线程访问 Redis
+        return self.local.get_or_load(key, load)
+
+    def stats(self) -> dict:
+        with self._lock:
+            shared = {"shared_hits": self.shared_hits, "stale_hits": self.stale_hits, "loads": self.loads}
+        return dict(self.local.stats(), **shared)
+
+
+_local_cache = None
+_local_cache_lock = threading.Lock()
+
+
+def get_local_cache() -> TTLCache:
+    """进程内所有 XhsClient 共享的缓存，话题、推荐 @ 用户的搜索结果与账号无关"""
+    global _local_cache
+    with _local_cache_lock:
+        if _local_cache is None:
+            _local_cache = TTLCache(TOPIC_CACHE_TTL, TOPIC_NEGATIVE_TTL, TOPIC_CACHE_SIZE)
+        return _local_cache
@@ -1,14 +1,28 @@
+import hashlib
 import json
 import os
+import random
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from io import BytesIO
 from typing import NamedTuple
+from urllib.parse import urlsplit
 from datetime import datetime
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from .exception import DataFetchError, IPBlockError, SignError, ErrorEnum, NeedBindPhoneError
+from .metrics import LOG_BODY_LIMIT, LOG_SAMPLE_RATE, RequestMetric, endpoint_template, get_metrics
+from .cache import SUGGEST_CACHE_TTL, get_local_cache
+from .multipart import UPLOAD_HOST, MultipartUploader
+from .permit import PERMIT_EXPIRE_MARGIN, UploadPermitPool, parse_upload_permits
+from .ratelimit import get_rate_limiter
+from .retry import get_retry_engine
+from .sign_strategy import LOCAL, BROWSER
 
 from .help import (
     cookie_jar_to_cookie_str,
@@ -20,7 +34,18 @@ from .help import (
     sign,
     update_session_cookies_from_cookie,
 )
-from ..utils import download_image
+from ..utils import FFMPEG_PATH, download_image, extract_video_frame, get_media_cache, open_upload_stream
+
+# 视频上传完成后第一次查询首帧的等待时间（秒）
+FIRST_FRAME_FIRST_DELAY = float(os.environ.get("XHS_FIRST_FRAME_FIRST_DELAY", 0.5))
+# 等待视频首帧的最长时间（秒），超过后不设置封面直接发布
+FIRST_FRAME_TIMEOUT = float(os.environ.get("XHS_FIRST_FRAME_TIMEOUT", 30))
+# 没有指定封面时，是否在本地用 ffmpeg 截取视频帧作为封面，不再等待服务端转码出首帧
+LOCAL_COVER = os.environ.get("XHS_LOCAL_COVER", "0") == "1"
+# 是否分片上传视频，分片接口还没有在线上验证过，默认单次流式上传
+MULTIPART_UPLOAD = os.environ.get("XHS_MULTIPART_UPLOAD", "0") == "1"
+# 签名请求在分布式限额用完时最多等待多少秒
+SIGNED_LIMIT_MAX_WAIT = float(os.environ.get("XHS_SIGNED_LIMIT_MAX_WAIT", 30))
 
 
 class FeedType(Enum):
@@ -97,14 +122,46 @@ class Note(NamedTuple):
 
 class XhsClient:
     def __init__(
-            self, cookie=None, user_agent=None, timeout=10, proxies=None, sign=None
+            self, cookie=None, user_agent=None, timeout=10, proxies=None, sign=None, sign_strategy=None,
+            pool_maxsize=10, upload_index=None, cache=None, metrics=None, rate_limiter=None,
+            distributed_limiter=None, retry_engine=None,
     ):
-        """constructor"""
+        """constructor
+
+        :param sign: 浏览器签名函数，非创作者接口使用
+        :param sign_strategy: 可选，AdaptiveSignStrategy，允许算法签名的接口优先使用进程内算法签名，失败时回退到 sign
+        :param pool_maxsize: 每个域名最多保持的连接数，超出时等待空闲连接
+        :param upload_index: 可选，UploadDedupIndex，同一账号相同内容的素材复用已上传的文件 id
+        :param cache: 可选，话题、推荐 @ 用户等搜索结果的缓存，TTLCache 或 SharedCache，默认使用进程内共享的 TTLCache
+        :param metrics: 可选，MetricsSink，记录每个请求的接口、状态码、错误类型、耗时、流量和签名耗时，
+            默认使用进程内共享的 InMemoryMetrics
+        :param rate_limiter: 可选，RateLimiter，按账号和出口 IP 自适应限速，默认使用进程内共享的 RateLimiter
+        :param distributed_limiter: 可选，DistributedLimiter，所有 worker 节点共享的每个账号的签名请求和发布限额
+        :param retry_engine: 可选，RetryEngine，单个接口调用失败时按错误类型重试，默认使用进程内共享的 RetryEngine
+        """
         self.proxies = proxies
         self.__session: requests.Session = requests.session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, pool_block=True)
+        self.__session.mount("https://", adapter)
+        self.__session.mount("http://", adapter)
         self.timeout = timeout
         self.sign = sign
+        self.sign_strategy = sign_strategy
+        # 预先批量计算好的签名，{(uri, data_str): [(signed_at, signs), ...]}
+        self._presigned = {}
+        self._presigned_lock = threading.Lock()
+        self.presign_ttl = 60
+        # 按文件类型缓存的上传许可池
+        self._permit_pools = {}
+        self._permit_pools_lock = threading.Lock()
+        self.upload_index = upload_index
+        self.cache = get_local_cache() if cache is None else cache
+        self.metrics = get_metrics() if metrics is None else metrics
+        self.rate_limiter = get_rate_limiter() if rate_limiter is None else rate_limiter
+        self.distributed_limiter = distributed_limiter
+        self.retry_engine = get_retry_engine() if retry_engine is None else retry_engine
         self._host = "https://edith.xiaohongshu.com"
+        self._upload_host = UPLOAD_HOST
         self.home = "https://www.xiaohongshu.com"
         user_agent = user_agent or (
             "Mozilla/5.0 "
@@ -119,6 +176,10 @@ class XhsClient:
         }
         self.cookie = cookie
 
+    def close(self):
+        """关闭连接池中的连接"""
+        self.__session.close()
+
     @property
     def cookie(self):
         return cookie_jar_to_cookie_str(self.__session.cookies)
@@ -143,53 +204,231 @@ class XhsClient:
     def user_agent(self, user_agent: str):
         self.__session.headers.update({"user-agent": user_agent})
 
-    def _pre_headers(self, url: str, data=None, is_creator: bool = False):
+    @staticmethod
+    def _presign_key(uri: str, data=None):
+        return uri, json.dumps(data, separators=(",", ":"), ensure_ascii=False) if isinstance(data, dict) else ""
+
+    @staticmethod
+    def _build_uri(uri: str, params=None):
+        if isinstance(params, dict):
+            return f"{uri}?" f"{'&'.join([f'{k}={v}' for k, v in params.items()])}"
+        return uri
+
+    def presign(self, requests: list):
+        """预先为一组即将发出的非创作者接口请求计算签名，签名器支持 sign_many 时只需要一次浏览器调用
+
+        :param requests: [(uri, data), ...]，GET 请求的 uri 需要带上查询参数（见 _build_uri），data 为 None
+        """
+        if self.sign_strategy:
+            # 会走算法签名的请求不需要浏览器预签名
+            requests = [(uri, data) for uri, data in requests if not self.sign_strategy.prefers_local(uri)]
+        if not requests or not self.sign:
+            return
+        a1 = self.cookie_dict.get("a1")
+        web_session = self.cookie_dict.get("web_session")
+        sign_many = getattr(self.sign, "sign_many", None)
+        if sign_many:
+            signs_list = sign_many(requests, a1=a1, web_session=web_session)
+        else:
+            signs_list = [self.sign(uri, data, a1=a1, web_session=web_session) for uri, data in requests]
+        now = time.time()
+        with self._presigned_lock:
+            # 预签名后没有用到的签名（例如话题后来命中了缓存）不会被 _take_presigned 取走，在这里清理过期的
+            for key in list(self._presigned):
+                entries = [entry for entry in self._presigned[key] if now - entry[0] < self.presign_ttl]
+                if entries:
+                    self._presigned[key] = entries
+                else:
+                    del self._presigned[key]
+            for (uri, data), signs in zip(requests, signs_list):
+                self._presigned.setdefault(self._presign_key(uri, data), []).append((now, signs))
+
+    def _take_presigned(self, uri: str, data=None):
+        key = self._presign_key(uri, data)
+        with self._presigned_lock:
+            entries = self._presigned.get(key)
+            while entries:
+                signed_at, signs = entries.pop(0)
+                if time.time() - signed_at < self.presign_ttl:
+                    return signs
+            self._presigned.pop(key, None)
+        return None
+
+    def _pre_headers(self, url: str, data=None, is_creator: bool = False, method: str = None):
+        """计算本次请求的签名请求头，返回 (headers, 使用的签名方式)
+
+        签名只放在单次请求的 headers 中，不写入 session，同一个客户端可以被多个线程同时使用
+
+        :param method: 可选，强制使用的签名方式，LOCAL 或 BROWSER，默认由 sign_strategy 决定
+        """
         if is_creator:
             signs = sign(url, data, a1=self.cookie_dict.get("a1"))
-            self.__session.headers.update({"x-s": signs["x-s"]})
-            self.__session.headers.update({"x-t": signs["x-t"]})
-            self.__session.headers.update({"x-s-common": signs["x-s-common"]})
+            return {
+                "x-s": signs["x-s"],
+                "x-t": signs["x-t"],
+                "x-s-common": signs["x-s-common"],
+            }, LOCAL
+        if method is None:
+            method = self.sign_strategy.choose(url) if self.sign_strategy else BROWSER
+        if method == LOCAL:
+            signs = self.sign_strategy.local_sign(url, data, a1=self.cookie_dict.get("a1"))
         else:
-            self.__session.headers.update(
-                self.sign(
-                    url,
-                    data,
-                    a1=self.cookie_dict.get("a1"),
-                    web_session=self.cookie_dict.get("web_session"),
-                )
+            signs = self._take_presigned(url, data) or self.sign(
+                url,
+                data,
+                a1=self.cookie_dict.get("a1"),
+                web_session=self.cookie_dict.get("web_session"),
             )
+        return dict(signs), method
+
+    @staticmethod
+    def _body_size(data) -> int:
+        if data is None:
+            return 0
+        if isinstance(data, (bytes, bytearray, str)):
+            return len(data)
+        if hasattr(data, "__len__"):
+            return len(data)
+        if hasattr(data, "getbuffer"):
+            return data.getbuffer().nbytes
+        return 0
+
+    @staticmethod
+    def _log_response(url: str, response: requests.Response, failed: bool):
+        """按采样比例打印响应内容，出错的请求总是打印，内容超过 LOG_BODY_LIMIT 时截断"""
+        if not failed and random.random() >= LOG_SAMPLE_RATE:
+            return
+        body = response.content[:LOG_BODY_LIMIT].decode("utf-8", "ignore")
+        if len(response.content) > LOG_BODY_LIMIT:
+            body += f"...（共 {len(response.content)} 字节）"
+        print(f"请求小红书接口返回结果：url={url}, status={response.status_code}, data={body}")
+
+    def request(self, method, url, sign_time: float = 0, sign_method: str = None, **kwargs):
+        """发送请求并解析返回结果，每个请求的指标记录到 self.metrics
+
+        :param sign_time: 计算签名的耗时（秒），由 _signed_request 传入
+        :param sign_method: 使用的签名方式，由 _signed_request 传入
+        """
+        started = time.time()
+        response = None
+        error = None
+        try:
+            response = self.__session.request(
+                method, url, timeout=self.timeout, proxies=self.proxies, **kwargs
+            )
+            if not len(response.content):
+                return response
+            data = response.json()
+            if data.get("success"):
+                self._log_response(url, response, failed=False)
+                return data.get("data", data.get("success"))
+            self._log_response(url, response, failed=True)
+            if data.get("code") == ErrorEnum.IP_BLOCK.value.code:
+                raise IPBlockError(ErrorEnum.IP_BLOCK.value.msg)
+            elif data.get("code") == ErrorEnum.SIGN_FAULT.value.code:
+                raise SignError(ErrorEnum.SIGN_FAULT.value.msg)
+            elif data.get("result") == ErrorEnum.NEED_BIND_PHONE.value.code:
+                raise NeedBindPhoneError(ErrorEnum.NEED_BIND_PHONE.value.msg)
+            else:
+                raise DataFetchError(data)
+        except Exception as e:
+            error = type(e).__name__
+            if response is not None and isinstance(e, ValueError):
+                self._log_response(url, response, failed=True)
+            raise
+        finally:
+            self.metrics.record(RequestMetric(
+                method=method,
+                endpoint=endpoint_template(url),
+                status=response.status_code if response is not None else None,
+                error=error,
+                latency=time.time() - started,
+                bytes_in=len(response.content) if response is not None else 0,
+                bytes_out=self._body_size(kwargs.get("data")),
+                sign_time=sign_time,
+                sign_method=sign_method,
+            ))
+
+    def _limited_request(self, method, url, fallback: bool = False, **kwargs):
+        """读取 / 抓取类接口（见 ratelimit.CRAWL_PATHS）拿到账号和出口的令牌后再发送请求，根据结果调整速率：
+        IPBlockError 同时降低账号和出口的速率，SignError 只降低账号的速率，成功时缓慢提速
+
+        配置了 distributed_limiter 时先检查所有节点共享的账号签名请求额度和该接口的读取额度（见 XHS_READ_PER_MINUTE），
+        超过 SIGNED_LIMIT_MAX_WAIT 还拿不到额度时抛出 RateLimitExceeded。发布额度由 create_note 单独申请。
+
+        :param fallback: SignError 之后是否还会换一种签名方式重试，此时签名被拒绝不代表被限流，不调整速率
+        """
+        account = self.cookie_dict.get("a1", "")
+        if self.distributed_limiter is not None:
+            self.distributed_limiter.acquire("xhs:signed", account, max_wait=SIGNED_LIMIT_MAX_WAIT)
+            self.distributed_limiter.acquire(
+                f"xhs:read:{urlsplit(url).path}", account, max_wait=SIGNED_LIMIT_MAX_WAIT
+            )
+        # 不需要限速的接口没有令牌桶，acquire / record 都不做任何事
+        keys = self.rate_limiter.keys(account, self.proxies) if self.rate_limiter.limits(urlsplit(url).path) else ()
+        self.rate_limiter.acquire(keys)
+        try:
+            result = self.request(method, url, **kwargs)
+        except IPBlockError:
+            self.rate_limiter.record(keys, throttled=True)
+            raise
+        except SignError:
+            if not fallback:
+                self.rate_limiter.record(keys[:1], throttled=True)
+            raise
+        except (DataFetchError, NeedBindPhoneError):
+            self.rate_limiter.record(keys, throttled=False)
+            raise
+        self.rate_limiter.record(keys, throttled=False)
+        return result
 
-    def request(self, method, url, **kwargs):
-        response = self.__session.request(
-            method, url, timeout=self.timeout, proxies=self.proxies, **kwargs
-        )
-        if not len(response.text):
-            return response
-        data = response.json()
-        print(f"请求小红书接口返回结果：url={url}, data={data}")
-        if data.get("success"):
-            return data.get("data", data.get("success"))
-        elif data.get("code") == ErrorEnum.IP_BLOCK.value.code:
-            raise IPBlockError(ErrorEnum.IP_BLOCK.value.msg)
-        elif data.get("code") == ErrorEnum.SIGN_FAULT.value.code:
-            raise SignError(ErrorEnum.SIGN_FAULT.value.msg)
-        elif data.get("result") == ErrorEnum.NEED_BIND_PHONE.value.code:
-            raise NeedBindPhoneError(ErrorEnum.NEED_BIND_PHONE.value.msg)
-        else:
-            raise DataFetchError(data)
+    def _signed_request(
+            self, method: str, uri: str, sign_data=None, is_creator: bool = False, sign_method: str = None,
+            headers: dict = None, **kwargs
+    ):
+        """签名并发送请求，算法签名被服务端拒绝（SignError）时改用浏览器签名重试一次"""
+        signed_at = time.time()
+        signs, sign_method = self._pre_headers(uri, sign_data, is_creator=is_creator, method=sign_method)
+        sign_time = time.time() - signed_at
+        request_headers = dict(headers or {}, **signs)
+        url = f"{self._host}{uri}"
+        if is_creator or self.sign_strategy is None:
+            return self._limited_request(method=method, url=url, headers=request_headers, sign_time=sign_time,
+                                         sign_method=sign_method, **kwargs)
+        try:
+            result = self._limited_request(method=method, url=url, fallback=sign_method == LOCAL,
+                                           headers=request_headers, sign_time=sign_time, sign_method=sign_method,
+                                           **kwargs)
+        except SignError:
+            self.sign_strategy.record(uri, sign_method, False)
+            if sign_method != LOCAL:
+                raise
+            print(f"算法签名被拒绝，改用浏览器签名重试：uri={uri}")
+            return self._signed_request(method, uri, sign_data, sign_method=BROWSER, headers=headers, **kwargs)
+        except (DataFetchError, IPBlockError, NeedBindPhoneError):
+            # 业务错误说明签名本身已经被服务端接受
+            self.sign_strategy.record(uri, sign_method, True)
+            raise
+        self.sign_strategy.record(uri, sign_method, True)
+        return result
 
     def get(self, uri: str, params=None, is_creator: bool = False, **kwargs):
-        final_uri = uri
-        if isinstance(params, dict):
-            final_uri = f"{uri}?" f"{'&'.join([f'{k}={v}' for k, v in params.items()])}"
-        self._pre_headers(final_uri, is_creator=is_creator)
-        return self.request(method="GET", url=f"{self._host}{final_uri}", **kwargs)
+        final_uri = self._build_uri(uri, params)
+        return self.retry_engine.call(
+            self.cookie_dict.get("a1", ""),
+            lambda: self._signed_request("GET", final_uri, is_creator=is_creator, **kwargs),
+            idempotent=True,
+            description=f"GET {uri}",
+        )
 
     def post(self, uri: str, data: dict, is_creator: bool = False, **kwargs):
-        self._pre_headers(uri, data, is_creator=is_creator)
         json_str = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
-        return self.request(
-            method="POST", url=f"{self._host}{uri}", data=json_str.encode("utf-8"), **kwargs
+        return self.retry_engine.call(
+            self.cookie_dict.get("a1", ""),
+            lambda: self._signed_request(
+                "POST", uri, data, is_creator=is_creator, data=json_str.encode("utf-8"), **kwargs
+            ),
+            description=f"POST {uri}",
         )
 
     def get_note_by_id(self, note_id: str):
@@ -416,55 +655,89 @@ class XhsClient:
         params = {"num": 30, "cursor": cursor, "user_id": user_id, "image_scenes": "FD_WM_WEBP"}
         return self.get(uri, params)
 
-    def get_user_all_notes(self, user_id: str, crawl_interval: int = 1):
+    def get_user_all_notes(self, user_id: str, crawl_interval: float = None, max_workers: int = 4):
         """get user all notes with more info, abnormal notes will be ignored
 
         :param user_id: user_id you want to fetch
         :type user_id: str
-        :param crawl_interval: sleep seconds, defaults to 1
-        :type crawl_interval: int, optional
+        :param crawl_interval: optional fixed sleep seconds between requests, defaults to None,
+            request pacing is left to rate_limiter
+        :type crawl_interval: float, optional
+        :param max_workers: max notes fetched at the same time, see iter_user_notes
+        :type max_workers: int, optional
         :return: note info
         :rtype: list[Note]
         """
-        has_more = True
-        cursor = ""
-        result = []
-        while has_more:
-            res = self.get_user_notes(user_id, cursor)
-            has_more = res["has_more"]
-            cursor = res["cursor"]
-            note_ids = map(lambda item: item["note_id"], res["notes"])
-
-            for note_id in note_ids:
-                try:
-                    note = self.get_note_by_id(note_id)
-                except DataFetchError as e:
-                    if (ErrorEnum.NOTE_ABNORMAL.value.msg in e.__repr__()
-                            or ErrorEnum.NOTE_SECRETE_FAULT.value.msg in e.__repr__()):
-                        continue
-                    else:
-                        raise
-                interact_info = note["interact_info"]
-                note_info = Note(
-                    note_id=note["note_id"],
-                    title=note["title"],
-                    desc=note["desc"],
-                    type=note["type"],
-                    user=note["user"],
-                    img_urls=get_imgs_url_from_note(note),
-                    video_url=get_video_url_from_note(note),
-                    tag_list=note["tag_list"],
-                    at_user_list=note["at_user_list"],
-                    collected_count=interact_info["collected_count"],
-                    comment_count=interact_info["comment_count"],
-                    liked_count=interact_info["liked_count"],
-                    share_count=interact_info["share_count"],
-                    time=note["time"],
-                    last_update_time=note["last_update_time"],
-                )
-                result.append(note_info)
-                time.sleep(crawl_interval)
-        return result
+        return list(self.iter_user_notes(user_id, crawl_interval=crawl_interval, max_workers=max_workers))
+
+    def iter_user_notes(self, user_id: str, crawl_interval: float = None, max_workers: int = 4):
+        """iterate user notes with more info, abnormal notes will be ignored
+
+        note details of a page are fetched concurrently (paced by rate_limiter) while the next page is
+        prefetched, notes are yielded in page order as soon as they are ready. stop iterating (break or
+        close the generator) to cancel the remaining requests.
+
+        :param user_id: user_id you want to fetch
+        :type user_id: str
+        :param crawl_interval: optional fixed sleep seconds after each note request, defaults to None
+        :type crawl_interval: float, optional
+        :param max_workers: max notes fetched at the same time, defaults to 4
+        :type max_workers: int, optional
+        :rtype: Iterator[Note]
+        """
+
+        def hydrate(note_id):
+            try:
+                return self._note_from_detail(self.get_note_by_id(note_id))
+            except DataFetchError as e:
+                if (ErrorEnum.NOTE_ABNORMAL.value.msg in e.__repr__()
+                        or ErrorEnum.NOTE_SECRETE_FAULT.value.msg in e.__repr__()):
+                    return None
+                raise
+            finally:
+                if crawl_interval:
+                    time.sleep(crawl_interval)
+
+        # one extra worker keeps the next page request from waiting behind note requests
+        executor = ThreadPoolExecutor(max_workers=max(1, max_workers) + 1)
+        futures = []
+        try:
+            page_future = executor.submit(self.get_user_notes, user_id, "")
+            while page_future is not None:
+                res = page_future.result()
+                page_future = None
+                if res["has_more"]:
+                    page_future = executor.submit(self.get_user_notes, user_id, res["cursor"])
+                futures = [executor.submit(hydrate, item["note_id"]) for item in res["notes"]]
+                for future in futures:
+                    note_info = future.result()
+                    if note_info is not None:
+                        yield note_info
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _note_from_detail(note: dict) -> Note:
+        interact_info = note["interact_info"]
+        return Note(
+            note_id=note["note_id"],
+            title=note["title"],
+            desc=note["desc"],
+            type=note["type"],
+            user=note["user"],
+            img_urls=get_imgs_url_from_note(note),
+            video_url=get_video_url_from_note(note),
+            tag_list=note["tag_list"],
+            at_user_list=note["at_user_list"],
+            collected_count=interact_info["collected_count"],
+            comment_count=interact_info["comment_count"],
+            liked_count=interact_info["liked_count"],
+            share_count=interact_info["share_count"],
+            time=note["time"],
+            last_update_time=note["last_update_time"],
+        )
 
     def get_note_comments(self, note_id: str, cursor: str = ""):
         """get note comments
@@ -503,10 +776,11 @@ class XhsClient:
         }
         return self.get(uri, params)
 
-    def get_note_all_comments(self, note_id: str, crawl_interval: int = 1):
+    def get_note_all_comments(self, note_id: str, crawl_interval: float = None):
         """get note all comments include sub comments
 
-        :param crawl_interval: crawl interval for fetch
+        :param crawl_interval: optional fixed sleep seconds between requests, defaults to None,
+            request pacing is left to rate_limiter
         :param note_id: note id you want to fetch
         :type note_id: str
         """
@@ -539,8 +813,10 @@ class XhsClient:
                     )
                     sub_comment_cursor = sub_comments_res["cursor"]
                     result.extend(sub_comments)
-                    time.sleep(crawl_interval)
-            time.sleep(crawl_interval)
+                    if crawl_interval:
+                        time.sleep(crawl_interval)
+            if crawl_interval:
+                time.sleep(crawl_interval)
         return result
 
     def comment_note(self, note_id: str, content: str):
@@ -658,13 +934,8 @@ class XhsClient:
         uri = "/api/im/redmoji/detail"
         return self.get(uri)["emoji"]["tabs"][0]["collection"]
 
-    def get_upload_files_permit(self, file_type: str, count: int = 1) -> tuple:
-        """获取文件上传的 id
-
-        :param file_type: 文件类型，["images", "video"]
-        :param count: 文件数量
-        :return:
-        """
+    @staticmethod
+    def _upload_permit_request(file_type: str, count: int = 1):
         uri = "/api/media/v1/upload/web/permit"
         params = {
             "biz_name": "spectrum",
@@ -673,10 +944,35 @@ class XhsClient:
             "version": "1",
             "source": "web",
         }
-        temp_permit = self.get(uri, params)["uploadTempPermits"][0]
-        file_id = temp_permit["fileIds"][0]
-        token = temp_permit["token"]
-        return file_id, token
+        return uri, params
+
+    def get_upload_files_permit(self, file_type: str, count: int = 1) -> tuple:
+        """获取文件上传的 id
+
+        :param file_type: 文件类型，["images", "video"]
+        :param count: 文件数量
+        :return:
+        """
+        permit = self.get_upload_files_permits(file_type, count)[0]
+        return permit.file_id, permit.token
+
+    def get_upload_files_permits(self, file_type: str, count: int = 1) -> list:
+        """一次请求批量获取多个文件上传的 id
+
+        :param file_type: 文件类型，["image", "video"]
+        :param count: 文件数量
+        :return: [UploadPermit(file_id, token, expire_at), ...]
+        """
+        uri, params = self._upload_permit_request(file_type, count)
+        return parse_upload_permits(self.get(uri, params)["uploadTempPermits"])
+
+    def permit_pool(self, file_type: str) -> UploadPermitPool:
+        """该账号某种文件类型的上传许可池，批量申请的许可在过期前可以被后续上传复用"""
+        with self._permit_pools_lock:
+            pool = self._permit_pools.get(file_type)
+            if pool is None:
+                pool = self._permit_pools[file_type] = UploadPermitPool(self, file_type)
+            return pool
 
     def upload_file(
             self,
@@ -684,6 +980,7 @@ class XhsClient:
             token: str,
             file_path: str,
             content_type: str = "image/jpeg",
+            stream: bool = False,
     ):
         """ 将文件上传至指定文件 id 处
 
@@ -691,15 +988,154 @@ class XhsClient:
         :param token: 上传授权验证 token
         :param file_path: 图像链接
         :param content_type:  【"video/mp4","image/jpeg","image/png"】
+        :param stream: 可选，边下载边上传，不把整个文件读入内存，适合视频等大文件
         :return:
         """
-        url = "https://ros-upload.xiaohongshu.com/" + file_id
-        headers = {"X-Cos-Security-Token": token, "Content-Type": content_type}
+        if stream:
+            with open_upload_stream(file_path) as body:
+                return self._put_file(file_id, token, body, content_type)
         bytes = download_image(file_path)
-        return self.request("PUT", url, data=bytes, headers=headers)
+        return self._put_file(file_id, token, bytes, content_type)
+
+    def upload_file_multipart(
+            self, file_id: str, token: str, file_path: str, content_type: str = "video/mp4", upload_id: str = None,
+            on_initiate=None,
+    ):
+        """分片上传大文件，分片并发上传并单独重试，中断后再次以同一个 file_id 上传时从已完成的分片继续
+
+        :param file_id: 上传文件 id
+        :param token: 上传授权验证 token
+        :param file_path: 文件链接
+        :param content_type: 文件类型
+        :param upload_id: 可选，之前为这个 file_id 发起过的分片上传 id
+        :param on_initiate: 可选，新发起分片上传后以 upload_id 调用
+        :return: 上传完成的 response
+        """
+        return MultipartUploader(self, upload_host=self._upload_host).upload(
+            file_id, token, file_path, content_type, upload_id=upload_id, on_initiate=on_initiate
+        )
+
+    def _put_file(self, file_id: str, token: str, data, content_type: str = "image/jpeg"):
+        url = self._upload_host + file_id
+        headers = {"X-Cos-Security-Token": token, "Content-Type": content_type}
+        # 内存中的文件可以从头重新上传，流式上传的数据读过就没有了，不能重试
+        rewindable = hasattr(data, "seek")
+
+        def put():
+            if rewindable:
+                data.seek(0)
+            return self.request("PUT", url, data=data, headers=headers)
+
+        return self.retry_engine.call(
+            self.cookie_dict.get("a1", ""), put, idempotent=rewindable, description=f"PUT {file_id}"
+        )
+
+    @property
+    def upload_account(self) -> str:
+        """上传去重索引中区分账号使用的标识"""
+        return self.cookie_dict.get("a1", "")
+
+    def find_uploaded(self, file_type: str, content_hash: str):
+        """同一账号上传过相同内容的文件时返回当时记录的信息，否则返回 None"""
+        if self.upload_index is None or not content_hash:
+            return None
+        return self.upload_index.get(self.upload_account, file_type, content_hash)
+
+    def remember_uploaded(self, file_type: str, content_hash: str, value: dict):
+        if self.upload_index is not None and content_hash:
+            self.upload_index.put(self.upload_account, file_type, content_hash, value)
+
+    def forget_uploaded(self, file_type: str, content_hash: str):
+        if self.upload_index is not None and content_hash:
+            self.upload_index.forget(self.upload_account, file_type, content_hash)
+
+    @staticmethod
+    def _load_image(file_path: str) -> tuple:
+        """下载源图片，返回 (图片内容, 内容哈希, 下载耗时)"""
+        started = time.time()
+        data = download_image(file_path)
+        return data, hashlib.sha256(data.getbuffer()).hexdigest(), round(time.time() - started, 3)
+
+    def _upload_image(self, file_path: str, permit=None, loaded: tuple = None) -> dict:
+        """下载源图片并上传，返回文件 id、内容哈希、是否复用了已上传的文件及各阶段耗时（秒）
+
+        :param permit: 可选，已经申请好的上传许可，默认从许可池中取
+        :param loaded: 可选，_load_image 已经下载好的结果
+        """
+        started = time.time()
+        data, content_hash, download_time = loaded or self._load_image(file_path)
+        uploaded = self.find_uploaded("image", content_hash)
+        if uploaded is not None:
+            return {
+                "file_id": uploaded["file_id"],
+                "content_hash": content_hash,
+                "reused": True,
+                "timings": {"permit": 0, "download": download_time, "upload": 0, "total": download_time},
+            }
+        loaded_at = time.time()
+        if permit is None:
+            permit = self.permit_pool("image").acquire()
+        permitted = time.time()
+        self._put_file(permit.file_id, permit.token, data)
+        finished = time.time()
+        self.remember_uploaded("image", content_hash, {"file_id": permit.file_id})
+        permit_time = round(permitted - loaded_at, 3)
+        upload_time = round(finished - permitted, 3)
+        return {
+            "file_id": permit.file_id,
+            "content_hash": content_hash,
+            "reused": False,
+            "timings": {
+                "permit": permit_time,
+                "download": download_time,
+                "upload": upload_time,
+                "total": round(download_time + finished - started, 3),
+            },
+        }
+
+    def upload_images(self, files: list, max_workers: int = 4) -> list:
+        """并发上传多张图片，返回结果与 files 顺序一致
+
+        配置了上传去重索引时，先下载所有图片计算内容哈希，只为没有上传过的图片申请许可。
+
+        :param files: 图片链接列表
+        :param max_workers: 最多同时上传的图片数量
+        :return: [{"file_id": "", "content_hash": "", "reused": False,
+                   "timings": {"permit": 0.1, "download": 0.2, "upload": 0.3, "total": 0.6}}, ...]
+        """
+        workers = min(max_workers, len(files))
+        if workers <= 1:
+            executor = None
+
+            def run(fn, *iterables):
+                return list(map(fn, *iterables))
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+
+            def run(fn, *iterables):
+                return list(executor.map(fn, *iterables))
+
+        try:
+            if self.upload_index is None:
+                loaded = [None] * len(files)
+                # 一次请求拿到所有图片的上传许可
+                permits = self.permit_pool("image").acquire_many(len(files))
+            else:
+                loaded = run(self._load_image, files)
+                missing = [
+                    index for index, (_, content_hash, _) in enumerate(loaded)
+                    if self.find_uploaded("image", content_hash) is None
+                ]
+                permits = [None] * len(files)
+                for index, permit in zip(missing, self.permit_pool("image").acquire_many(len(missing))):
+                    permits[index] = permit
+            return run(self._upload_image, files, permits, loaded)
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
     def get_suggest_topic(self, keyword=""):
-        """通过关键词获取话题信息，发布笔记用
+        """通过关键词获取话题信息，发布笔记用，结果缓存在 cache 中
 
         :param keyword: 话题关键词，如 Python
         :return:
@@ -710,64 +1146,100 @@ class XhsClient:
             "suggest_topic_request": {"title": "", "desc": ""},
             "page": {"page_size": 20, "page": 1},
         }
-        return self.post(uri, data)["topic_info_dtos"]
+        return self.cache.get_or_load(
+            f"suggest_topic:{keyword}", lambda: self.post(uri, data)["topic_info_dtos"], ttl=SUGGEST_CACHE_TTL
+        )
 
     def get_suggest_ats(self, keyword=""):
-        """通过关键词获取用户信息，发布笔记用
+        """通过关键词获取用户信息，发布笔记用，结果缓存在 cache 中
 
         :param keyword: 用户名关键词，如 ReaJason
         :return:
         """
         uri = "/web_api/sns/v1/search/user_info"
-        data = {
-            "keyword": keyword,
-            "search_id": str(time.time() * 1000),
-            "page": {"page_size": 20, "page": 1},
-        }
-        return self.post(uri, data)["user_info_dtos"]
 
-    def search_tags(self, topics):
-        hashtags = []
-        for topic in topics:
-            uri = "/web_api/sns/v1/search/topic"
+        def load():
             data = {
-                "keyword": topic,
-                "page": {
-                    "page": 1,
-                    "page_size": 20
-                },
-                "suggest_topic_request": {
-                    "desc": f"#{topic}",
-                    "title": ""
-                }
+                "keyword": keyword,
+                "search_id": str(time.time() * 1000),
+                "page": {"page_size": 20, "page": 1},
+            }
+            return self.post(uri, data)["user_info_dtos"]
+
+        return self.cache.get_or_load(f"suggest_ats:{keyword}", load, ttl=SUGGEST_CACHE_TTL)
+
+    @staticmethod
+    def _search_tag_request(topic: str):
+        uri = "/web_api/sns/v1/search/topic"
+        data = {
+            "keyword": topic,
+            "page": {
+                "page": 1,
+                "page_size": 20
+            },
+            "suggest_topic_request": {
+                "desc": f"#{topic}",
+                "title": ""
             }
-            headers = {
-                "Referer": "https://creator.xiaohongshu.com/"
+        }
+        return uri, data
+
+    def search_tag(self, topic: str):
+        """搜索单个话题，返回第一个匹配的话题，没有匹配时返回 None"""
+        uri, data = self._search_tag_request(topic)
+        headers = {
+            "Referer": "https://creator.xiaohongshu.com/"
+        }
+        res = self.post(uri, data, headers=headers)
+        topic_info_dtos = res.get('topic_info_dtos', [])
+        if len(topic_info_dtos) > 0:
+            hashtag = topic_info_dtos[0]
+            print(f"搜索 topic {topic} 结果：{hashtag['name']}（{hashtag['id']}）")
+            return {
+                "id": hashtag['id'],
+                "link": hashtag['link'],
+                "name": hashtag['name'],
+                "type": "topic"
             }
-            res = self.post(uri, data, headers=headers)
-            print(f"搜索 topic {topic} 结果：", res)
-            topic_info_dtos = res.get('topic_info_dtos', [])
-            if len(topic_info_dtos) > 0:
-                hashtag = topic_info_dtos[0]
-                hashtags.append({
-                    "id": hashtag['id'],
-                    "link": hashtag['link'],
-                    "name": hashtag['name'],
-                    "type": "topic"
-                })
-        return hashtags
+        print(f"搜索 topic {topic} 没有结果")
+        return None
+
+    def search_tags(self, topics, max_workers: int = 4):
+        """搜索话题，返回匹配到的话题列表，顺序与 topics 一致
+
+        结果（包括没有匹配的话题）缓存在 cache 中，多个话题并发查询缓存，未缓存的话题并发搜索。
+
+        :param topics: 话题名称列表
+        :param max_workers: 最多同时搜索的话题数量
+        """
+        names = list(dict.fromkeys(topics))
+
+        def resolve(topic):
+            return self.cache.get_or_load(f"topic:{topic}", lambda: self.search_tag(topic))
+
+        if len(names) > 1 and max_workers > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(names))) as executor:
+                resolved = list(executor.map(resolve, names))
+        else:
+            resolved = [resolve(topic) for topic in names]
+        return [dict(hashtag) for hashtag in resolved if hashtag is not None]
 
     def create_note(self, title, desc, note_type, ats: list = None, topics: list = None,
                     image_info: dict = None,
                     video_info: dict = None,
-                    post_time: str = None, is_private: bool = False):
+                    post_time: str = None, is_private: bool = False, hash_tags: list = None):
+        """
+        :param hash_tags: 可选，已经通过 search_tags 搜索好的话题，传入时不再搜索 topics
+
+        配置了 distributed_limiter 时每次调用申请一个 xhs:publish 额度，用完时抛出 RateLimitExceeded。
+        """
         if post_time:
             post_date_time = datetime.strptime(post_time, "%Y-%m-%d %H:%M:%S")
             post_time = round(int(post_date_time.timestamp()) * 1000)
 
-        hash_tag = []
-        if len(topics):
-            hash_tag = self.search_tags(topics)
+        hash_tag = hash_tags
+        if hash_tag is None:
+            hash_tag = self.search_tags(topics) if topics else []
 
         uri = "/web_api/sns/v2/note"
         business_binds = {
@@ -802,6 +1274,9 @@ class XhsClient:
             "Referer": "https://creator.xiaohongshu.com/"
         }
         print(f"请求小红书接口：url={uri}, data={data}")
+        if self.distributed_limiter is not None:
+            # 每篇笔记只占用一个发布额度，在重试和签名方式回退之外申请
+            self.distributed_limiter.acquire("xhs:publish", self.cookie_dict.get("a1", ""))
         return self.post(uri, data, headers=headers)
 
     def create_image_note(
@@ -813,6 +1288,8 @@ class XhsClient:
             ats: list = None,
             topics: list = None,
             is_private: bool = False,
+            upload_concurrency: int = 4,
+            checkpoint=None,
     ):
         """发布图文笔记
 
@@ -823,6 +1300,8 @@ class XhsClient:
         :param ats: 可选，@用户信息
         :param topics: 可选，话题信息
         :param is_private: 可选，是否私密发布
+        :param upload_concurrency: 可选，最多同时上传的图片数量
+        :param checkpoint: 可选，TaskCheckpoint，保存上传的图片、话题和发布结果，任务重试时跳过已经完成的阶段
         :return:
         """
         if ats is None:
@@ -830,21 +1309,95 @@ class XhsClient:
         if topics is None:
             topics = []
 
+        note = self._checkpointed(checkpoint, "note", None)
+        if note is not None:
+            return note
+
+        started = time.time()
+        timings = {}
+        hash_tags = self._checkpointed(checkpoint, "hash_tags", None)
+        if hash_tags is None:
+            # 话题搜索的请求是已知的，先一次性算好未缓存话题的签名；SharedCache 在 Redis 中命中的话题会写入进程内缓存，
+            # 随后的 search_tags 不会再次访问 Redis
+            pending = [topic for topic in topics if f"topic:{topic}" not in self.cache]
+            if pending:
+                self.presign([self._search_tag_request(topic) for topic in pending])
+
+        # 话题搜索与图片上传同时进行
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            topics_future = None
+            if hash_tags is None:
+                topics_future = executor.submit(
+                    self._timed, timings, "topics", self._checkpointed, checkpoint, "hash_tags", self.search_tags,
+                    topics
+                )
+            uploads = self._timed(timings, "upload_images", self._checkpointed, checkpoint, "images",
+                                  self.upload_images, files, max_workers=upload_concurrency)
+            if topics_future is not None:
+                hash_tags = topics_future.result()
+
         images = []
-        for file in files:
-            image_id, token = self.get_upload_files_permit("image")
-            self.upload_file(image_id, token, file)
+        for index, uploaded in enumerate(uploads):
+            if uploaded["reused"]:
+                print(f"第 {index + 1} 张图片已上传过，复用 file_id={uploaded['file_id']}")
+            else:
+                print(f"第 {index + 1} 张图片上传完成：file_id={uploaded['file_id']}, 耗时={uploaded['timings']}")
             images.append(
                 {
-                    "file_id": image_id,
+                    "file_id": uploaded["file_id"],
                     "metadata": {"source": -1},
                     "stickers": {"version": 2, "floating": []},
                     "extra_info_json": '{"mimeType":"image/jpeg"}',
                 }
             )
-        return self.create_note(title, desc, NoteType.NORMAL.value, ats=ats, topics=topics,
-                                image_info={"images": images}, is_private=is_private,
-                                post_time=post_time)
+        try:
+            note = self._timed(timings, "create_note", self.create_note, title, desc, NoteType.NORMAL.value,
+                               ats=ats, topics=topics, image_info={"images": images}, is_private=is_private,
+                               post_time=post_time, hash_tags=hash_tags)
+        except Exception:
+            # 复用的文件可能已经失效，下次重新上传
+            reused = [uploaded for uploaded in uploads if uploaded["reused"]]
+            for uploaded in reused:
+                self.forget_uploaded("image", uploaded["content_hash"])
+            if reused and checkpoint is not None:
+                checkpoint.set("images", None)
+            raise
+        timings["total"] = round(time.time() - started, 3)
+        print(f"图文笔记发布完成，各阶段耗时：{timings}")
+        note["timings"] = timings
+        if checkpoint is not None:
+            checkpoint.set("note", note)
+        return note
+
+    @staticmethod
+    def _checkpointed(checkpoint, stage: str, func, *args, **kwargs):
+        """检查点中有该阶段的结果时直接返回，否则执行 func 并保存结果；func 为 None 时只读取"""
+        if checkpoint is not None:
+            value = checkpoint.get(stage)
+            if value is not None:
+                print(f"从检查点恢复阶段结果：{stage}")
+                return value
+        if func is None:
+            return None
+        value = func(*args, **kwargs)
+        if checkpoint is not None and value is not None:
+            checkpoint.set(stage, value)
+        return value
+
+    @staticmethod
+    def _timed(timings: dict, stage: str, func, *args, **kwargs):
+        """执行 func 并把耗时（秒）记录到 timings[stage]"""
+        started = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings[stage] = round(time.time() - started, 3)
+
+    @staticmethod
+    def _cached_content_hash(url: str):
+        media_cache = get_media_cache()
+        cached = media_cache.lookup(url) if media_cache is not None else None
+        return cached[1] if cached is not None else None
 
     def get_video_first_frame_image_id(self, video_id: str):
         headers = {
@@ -867,6 +1420,54 @@ class XhsClient:
             return image_id
         return None
 
+    def wait_video_first_frame(
+            self,
+            video_id: str,
+            timeout: float = FIRST_FRAME_TIMEOUT,
+            first_delay: float = FIRST_FRAME_FIRST_DELAY,
+            max_delay: float = 3,
+    ):
+        """等待视频转码出首帧，返回首帧的文件 id，超时返回 None
+
+        第一次很快查询，之后按指数退避（带随机抖动）拉长间隔，间隔不超过 max_delay，总时长不超过 timeout。
+        """
+        deadline = time.time() + timeout
+        delay = first_delay
+        attempts = 0
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                print(f"等待视频首帧超时：video_id={video_id}, 查询 {attempts} 次")
+                return None
+            time.sleep(min(random.uniform(delay / 2, delay), remaining))
+            attempts += 1
+            try:
+                image_id = self.get_video_first_frame_image_id(video_id)
+            except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+                print(f"查询视频首帧失败：{e}")
+                image_id = None
+            if image_id:
+                return image_id
+            delay = min(delay * 2, max_delay)
+
+    def _upload_cover(self, cover_path: str) -> str:
+        permit = self.permit_pool("image").acquire()
+        self.upload_file(permit.file_id, permit.token, cover_path)
+        return permit.file_id
+
+    def _upload_local_cover(self, video_path: str, ts: float = 0):
+        """在本地截取视频帧作为封面上传，返回文件 id，失败时返回 None"""
+        try:
+            data = extract_video_frame(video_path, ts)
+            if data is None:
+                return None
+            permit = self.permit_pool("image").acquire()
+            self._put_file(permit.file_id, permit.token, BytesIO(data))
+            return permit.file_id
+        except Exception as e:
+            print(f"上传本地截取的封面失败：{e}")
+            return None
+
     def create_video_note(
             self,
             title,
@@ -877,7 +1478,12 @@ class XhsClient:
             post_time: str = None,
             topics: list = None,
             is_private: bool = False,
-            wait_time: int = 3,
+            wait_time: float = 3,
+            multipart: bool = MULTIPART_UPLOAD,
+            first_frame_timeout: float = FIRST_FRAME_TIMEOUT,
+            local_cover: bool = LOCAL_COVER,
+            cover_ts: float = 0,
+            checkpoint=None,
     ):
         """发布视频笔记
 
@@ -889,8 +1495,13 @@ class XhsClient:
         :param post_time: 可选，发布时间
         :param topics: 可选，话题信息
         :param is_private: 可选，是否私密发布
-        :param wait_time: 可选，默认 3 s，循环等待获取视频第一帧为笔记封面
-        :return:
+        :param wait_time: 可选，默认 3 s，等待视频第一帧作为笔记封面时两次查询的最大间隔
+        :param multipart: 可选，是否分片上传视频，默认由 XHS_MULTIPART_UPLOAD 决定，不开启时单次流式上传
+        :param first_frame_timeout: 可选，等待视频第一帧的最长时间（秒）
+        :param local_cover: 可选，没有指定封面时在本地用 ffmpeg 截取视频帧作为封面，与视频上传同时进行，失败时仍然等待服务端首帧
+        :param cover_ts: 可选，本地截取第几秒的画面作为封面
+        :param checkpoint: 可选，TaskCheckpoint，保存视频 id、封面、话题和发布结果，任务重试时跳过已经完成的阶段
+        :return: 发布结果，timings 为各阶段耗时（秒）
         :rtype: object
         """
         if ats is None:
@@ -898,40 +1509,114 @@ class XhsClient:
         if topics is None:
             topics = []
 
-        file_id, token = self.get_upload_files_permit("video")
-        res = self.upload_file(
-            file_id,
-            token,
-            video_path,
-            content_type="video/mp4",
-        )
-        video_id, is_upload = res.headers["X-Ros-Video-Id"], False
+        note = self._checkpointed(checkpoint, "note", None)
+        if note is not None:
+            return note
+
+        started = time.time()
+        timings = {}
+        cover = self._checkpointed(checkpoint, "cover", None)
+        # 话题搜索、封面上传与视频上传及等待转码同时进行
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            topics_future = executor.submit(
+                self._timed, timings, "topics", self._checkpointed, checkpoint, "hash_tags", self.search_tags, topics
+            )
+            cover_future = None
+            # 封面对应视频中的第几秒，只有本地截取的封面知道
+            frame_ts = 0
+            if cover is None and cover_path:
+                cover_future = executor.submit(self._timed, timings, "cover", self._upload_cover, cover_path)
+            elif cover is None and local_cover and FFMPEG_PATH:
+                cover_future = executor.submit(
+                    self._timed, timings, "cover", self._upload_local_cover, video_path, cover_ts
+                )
+                frame_ts = cover_ts
 
-        image_id = None
-        if cover_path is None:
-            for _ in range(10):
-                time.sleep(wait_time)
-                image_id = self.get_video_first_frame_image_id(video_id)
-                if image_id:
-                    break
+            video = self._checkpointed(
+                checkpoint, "video", self._upload_video, video_path, multipart, timings, checkpoint
+            )
 
-        if cover_path:
-            is_upload = True
-            image_id, token = self.get_upload_files_permit("image")
-            self.upload_file(image_id, token, cover_path)
+            if cover is None:
+                image_id = cover_future.result() if cover_future is not None else None
+                is_upload = image_id is not None
+                if image_id is None:
+                    frame_ts = 0
+                    image_id = self._timed(timings, "first_frame", self.wait_video_first_frame, video["video_id"],
+                                           timeout=first_frame_timeout, max_delay=wait_time)
+                cover = {"file_id": image_id, "is_upload": is_upload, "ts": frame_ts}
+                if image_id and checkpoint is not None:
+                    checkpoint.set("cover", cover)
+            hash_tags = topics_future.result()
 
         cover_info = {
-            "file_id": image_id,
-            "frame": {"ts": 0, "is_user_select": False, "is_upload": is_upload},
+            "file_id": cover["file_id"],
+            "frame": {"ts": cover.get("ts", 0), "is_user_select": False, "is_upload": cover["is_upload"]},
         }
 
         video_info = {
-            "file_id": file_id,
+            "file_id": video["file_id"],
             "timelines": [],
             "cover": cover_info,
             "chapters": [],
             "chapter_sync_text": False,
             "entrance": "web",
         }
-        return self.create_note(title, desc, NoteType.VIDEO.value, ats=ats, topics=topics, video_info=video_info,
-                                post_time=post_time, is_private=is_private)
+        try:
+            note = self._timed(timings, "create_note", self.create_note, title, desc, NoteType.VIDEO.value,
+                               ats=ats, topics=topics, video_info=video_info, post_time=post_time,
+                               is_private=is_private, hash_tags=hash_tags)
+        except Exception:
+            if video["reused"]:
+                self.forget_uploaded("video", video["content_hash"])
+                # 封面（服务端首帧）和上传许可都跟着视频走，视频重新上传时一起作废
+                if checkpoint is not None:
+                    for stage in ("video", "cover", "video_permit"):
+                        checkpoint.set(stage, None)
+            raise
+        timings["total"] = round(time.time() - started, 3)
+        print(f"视频笔记发布完成，各阶段耗时：{timings}")
+        note["timings"] = timings
+        if checkpoint is not None:
+            checkpoint.set("note", note)
+        return note
+
+    def _video_permit(self, checkpoint=None) -> dict:
+        """视频的上传许可，保存在检查点的 video_permit 阶段中，任务重试时沿用同一个 file_id，分片上传才能从进度文件继续"""
+        permit = self._checkpointed(checkpoint, "video_permit", None)
+        if permit is not None and permit["expire_at"] - time.time() > PERMIT_EXPIRE_MARGIN:
+            return permit
+        permit = self.get_upload_files_permits("video")[0]._asdict()
+        if checkpoint is not None:
+            checkpoint.set("video_permit", permit)
+        return permit
+
+    def _upload_video(self, video_path: str, multipart: bool = MULTIPART_UPLOAD, timings: dict = None,
+                      checkpoint=None) -> dict:
+        """上传视频，同一账号上传过相同内容时直接复用，返回 {"file_id", "video_id", "content_hash", "reused"}
+
+        传入 checkpoint 时，上传许可和分片上传的 upload_id 在上传开始前保存到检查点，任务重试时继续之前的上传。
+        """
+        timings = {} if timings is None else timings
+        # 视频在素材缓存中时才知道内容哈希，不为了去重单独下载整个视频；上传时会顺带写入缓存，上传完成后再取哈希
+        content_hash = self._cached_content_hash(video_path)
+        uploaded = self.find_uploaded("video", content_hash)
+        if uploaded is not None:
+            print(f"视频已上传过，复用 file_id={uploaded['file_id']}")
+            return dict(uploaded, content_hash=content_hash, reused=True)
+        permit = self._video_permit(checkpoint)
+        file_id, token = permit["file_id"], permit["token"]
+        if multipart:
+            def save_upload_id(upload_id):
+                if checkpoint is not None:
+                    checkpoint.set("video_permit", dict(permit, upload_id=upload_id))
+
+            res = self._timed(timings, "upload_video", self.upload_file_multipart, file_id, token,
+                              video_path, content_type="video/mp4", upload_id=permit.get("upload_id"),
+                              on_initiate=save_upload_id)
+        else:
+            res = self._timed(timings, "upload_video", self.upload_file, file_id, token, video_path,
+                              content_type="video/mp4", stream=True)
+        video_id = res.headers["X-Ros-Video-Id"]
+        content_hash = content_hash or self._cached_content_hash(video_path)
+        self.remember_uploaded("video", content_hash, {"file_id": file_id, "video_id": video_id})
+        return {"file_id": file_id, "video_id": video_id, "content_hash": content_hash, "reused": False}
@@ -29,3 +29,7 @@ class SignError(RequestException):
 
 class NeedBindPhoneError(RequestException):
     pass
+
+
+class CircuitOpenError(RequestException):
+    """the account has been ip blocked repeatedly, requests are paused for a while"""
@@ -0,0 +1,158 @@
+import os
+import re
+import threading
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+# 请求耗时直方图的分桶上限（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 打印响应内容的采样比例，出错的请求总是打印
+LOG_SAMPLE_RATE = float(os.environ.get("XHS_LOG_SAMPLE_RATE", 0.05))
+# 打印响应内容时最多打印多少个字符
+LOG_BODY_LIMIT = int(os.environ.get("XHS_LOG_BODY_LIMIT", 2000))
+
+# 路径中看起来像 id 的部分：包含数字且长度不少于 8 的片段
+_ID_SEGMENT = re.compile(r"^(?=.*\d)[\w\-.]{8,}$")
+
+
+def endpoint_template(url: str) -> str:
+    """把请求地址归一化为接口模板，去掉查询参数，路径中的 id 替换为 {id}，例如 /api/sns/web/v1/note/{id}"""
+    parts = urlsplit(url)
+    segments = ["{id}" if _ID_SEGMENT.match(segment) else segment for segment in parts.path.split("/")]
+    return f"{parts.netloc}{'/'.join(segments)}"
+
+
+class RequestMetric(NamedTuple):
+    method: str
+    endpoint: str
+    # HTTP 状态码，没有收到响应时为 None
+    status: int
+    # 异常类名，例如 IPBlockError、SignError，成功时为 None
+    error: str
+    # 请求耗时（秒），不包含签名
+    latency: float
+    bytes_in: int
+    bytes_out: int
+    # 计算签名的耗时（秒），不需要签名的请求为 0
+    sign_time: float = 0
+    # 签名方式，LOCAL 或 BROWSER，不需要签名的请求为 None
+    sign_method: str = None
+
+
+class MetricsSink:
+    """请求指标的接收方，继承后实现 record，例如转发到 Prometheus / StatsD"""
+
+    def record(self, metric: RequestMetric):
+        raise NotImplementedError
+
+    def set_gauge(self, name: str, key: str, value: float):
+        """记录当前值类型的指标，例如限速器的当前速率，默认忽略"""
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float):
+        """按分桶估算分位数，返回所在分桶的上限"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.count = 0
+        self.statuses = {}
+        self.errors = {}
+        self.latency = Histogram()
+        self.sign_time = Histogram()
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "statuses": dict(self.statuses),
+            "errors": dict(self.errors),
+            "latency": self.latency.to_dict(),
+            "sign_time": self.sign_time.to_dict(),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+
+class InMemoryMetrics(MetricsSink):
+    """在进程内按 (method, endpoint) 汇总请求指标，snapshot() 返回当前的统计结果及各项当前值"""
+
+    def __init__(self):
+        self._endpoints = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def record(self, metric: RequestMetric):
+        key = f"{metric.method} {metric.endpoint}"
+        with self._lock:
+            stats = self._endpoints.get(key)
+            if stats is None:
+                stats = self._endpoints[key] = EndpointMetrics()
+            stats.count += 1
+            status = str(metric.status)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            if metric.error:
+                stats.errors[metric.error] = stats.errors.get(metric.error, 0) + 1
+            stats.latency.observe(metric.latency)
+            if metric.sign_method is not None:
+                stats.sign_time.observe(metric.sign_time)
+            stats.bytes_in += metric.bytes_in
+            stats.bytes_out += metric.bytes_out
+
+    def set_gauge(self, name: str, key: str, value: float):
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "endpoints": {key: stats.to_dict() for key, stats in self._endpoints.items()},
+                "gauges": {name: dict(values) for name, values in self._gauges.items()},
+            }
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> InMemoryMetrics:
+    """进程内所有 XhsClient 默认共用的指标汇总"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = InMemoryMetrics()
+        return _metrics
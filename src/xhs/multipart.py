@@ -0,0 +1,346 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+import requests
+
+from .metrics import RequestMetric, endpoint_template
+from ..utils import UploadStream, get_and_ensure_exists_tmp_files_folder, get_media_cache, open_upload_stream
+
+UPLOAD_HOST = "https://ros-upload.xiaohongshu.com/"
+# 分片大小
+MULTIPART_PART_SIZE = int(os.environ.get("XHS_MULTIPART_PART_SIZE_MB", 8)) * 1024 * 1024
+# 同时上传的分片数量
+MULTIPART_CONCURRENCY = int(os.environ.get("XHS_MULTIPART_CONCURRENCY", 4))
+# 单个分片失败后的重试次数
+MULTIPART_PART_RETRIES = 3
+# 分片上传进度文件保留多少秒，超过后上传许可早已过期，不可能再继续
+MANIFEST_MAX_AGE = 24 * 3600
+
+
+def get_manifest_folder():
+    folder = os.path.join(get_and_ensure_exists_tmp_files_folder(), "upload-manifests")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def cleanup_manifests(max_age: float = MANIFEST_MAX_AGE):
+    """删除长时间没有更新的进度文件，一般是没有再重试的失败任务留下的"""
+    folder = get_manifest_folder()
+    now = time.time()
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class RangeSource:
+    """支持 Range 请求的源地址，每个分片单独按范围下载"""
+
+    def __init__(self, url: str, size: int):
+        self.url = url
+        self.size = size
+
+    def read(self, offset: int, length: int) -> bytes:
+        response = requests.get(self.url, headers={"Range": f"bytes={offset}-{offset + length - 1}"})
+        response.raise_for_status()
+        if response.status_code != 206 or len(response.content) != length:
+            raise Exception(f"源文件分片读取失败：offset={offset}, length={length}")
+        return response.content
+
+    def close(self):
+        pass
+
+
+class CachingRangeSource(RangeSource):
+    """按范围读取分片的同时写入素材缓存目录下的临时文件，所有字节都读到过时，关闭后把文件放进素材缓存
+
+    分片上传完成后就能得到视频的内容哈希，用于上传去重；从进度文件继续的上传跳过了部分分片，不会放进缓存。
+    """
+
+    def __init__(self, url: str, size: int, media_cache):
+        super().__init__(url, size)
+        self.media_cache = media_cache
+        self._path = media_cache.tmp_path()
+        self._fd = os.open(self._path, os.O_WRONLY | os.O_CREAT, 0o644)
+        self._ranges = {}
+        self._lock = threading.Lock()
+
+    def read(self, offset: int, length: int) -> bytes:
+        data = super().read(offset, length)
+        os.pwrite(self._fd, data, offset)
+        with self._lock:
+            self._ranges[offset] = length
+        return data
+
+    def close(self):
+        os.close(self._fd)
+        if sum(self._ranges.values()) == self.size:
+            try:
+                self.media_cache.add_file(self.url, self._path)
+                return
+            except OSError as e:
+                print(f"写入素材缓存失败：{e}")
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
+
+
+class FileSource:
+    """从本地文件中读取分片：源地址已在素材缓存中，或不支持 Range 时先完整下载到本地临时文件
+
+    :param remove: 关闭时是否删除文件，素材缓存中的文件不删除
+    """
+
+    def __init__(self, path: str, remove: bool = True):
+        self.path = path
+        self.remove = remove
+        self._fd = os.open(path, os.O_RDONLY)
+        self.size = os.fstat(self._fd).st_size
+
+    def read(self, offset: int, length: int) -> bytes:
+        return os.pread(self._fd, length, offset)
+
+    def close(self):
+        os.close(self._fd)
+        if not self.remove:
+            return
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def open_part_source(url: str):
+    """打开分片上传的源文件
+
+    已在素材缓存中的直接读取缓存文件；支持 Range 的源地址按分片下载，大小不超过缓存上限四分之一的同时写入缓存；
+    不支持 Range 时先完整下载，能放进缓存的下载到缓存中，否则下载到临时文件。
+    """
+    media_cache = get_media_cache()
+    if media_cache is not None:
+        cached = media_cache.get(url)
+        if cached is not None:
+            return FileSource(cached[0], remove=False)
+    response = requests.get(url, headers={"Range": "bytes=0-0"}, stream=True)
+    response.raise_for_status()
+    content_range = response.headers.get("Content-Range", "")
+    match = re.match(r"bytes 0-0/(\d+)", content_range)
+    if response.status_code == 206 and match:
+        response.close()
+        size = int(match.group(1))
+        if media_cache is not None and size <= media_cache.max_size // 4:
+            return CachingRangeSource(url, size, media_cache)
+        return RangeSource(url, size)
+    length = response.headers.get("Content-Length")
+    if media_cache is not None and length is not None and int(length) <= media_cache.max_size // 4:
+        path, _ = media_cache.fetch(url, response=response)
+        return FileSource(path, remove=False)
+    with response:
+        path = os.path.join(get_and_ensure_exists_tmp_files_folder(), f"multipart-{os.getpid()}-{time.time_ns()}")
+        with open(path, "wb") as f:
+            for chunk in response.iter_content(1024 * 1024):
+                f.write(chunk)
+    return FileSource(path)
+
+
+class UploadManifest:
+    """分片上传的进度记录，保存在 tmp-files/upload-manifests/<file_id>.json，上传中断后可以从已完成的分片继续"""
+
+    def __init__(self, file_id: str, source: str, size: int, part_size: int):
+        self.path = os.path.join(get_manifest_folder(), f"{file_id.replace('/', '_')}.json")
+        self.file_id = file_id
+        self.source = source
+        self.size = size
+        self.part_size = part_size
+        self.upload_id = None
+        self.parts = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> bool:
+        """读取已有的进度，源文件或分片大小不一致时忽略"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if (data.get("source"), data.get("size"), data.get("part_size")) != (self.source, self.size, self.part_size):
+            return False
+        self.upload_id = data["upload_id"]
+        self.parts = {int(number): etag for number, etag in data["parts"].items()}
+        return True
+
+    def complete_part(self, number: int, etag: str):
+        with self._lock:
+            self.parts[number] = etag
+            self.save()
+
+    def save(self):
+        data = {
+            "file_id": self.file_id,
+            "source": self.source,
+            "size": self.size,
+            "part_size": self.part_size,
+            "upload_id": self.upload_id,
+            "parts": self.parts,
+        }
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class MultipartUploader:
+    """视频分片上传
+
+    分片并发上传，每个分片独立重试，已完成的分片记录在本地进度文件中，同一个 file_id 再次上传时跳过这些分片。
+    文件不超过一个分片，或上传服务不接受分片上传时，回退为流式单次 PUT。
+    """
+
+    def __init__(
+            self,
+            client,
+            part_size: int = MULTIPART_PART_SIZE,
+            max_workers: int = MULTIPART_CONCURRENCY,
+            part_retries: int = MULTIPART_PART_RETRIES,
+            upload_host: str = UPLOAD_HOST,
+    ):
+        """
+        :param client: XhsClient，使用它的 session、代理和超时设置
+        """
+        self.client = client
+        self.part_size = part_size
+        self.max_workers = max_workers
+        self.part_retries = part_retries
+        self.upload_host = upload_host
+
+    def _request(self, method: str, url: str, token: str, **kwargs):
+        headers = dict(kwargs.pop("headers", {}), **{"X-Cos-Security-Token": token})
+        started = time.time()
+        response = None
+        error = None
+        try:
+            response = self.client.session.request(
+                method, url, headers=headers, timeout=self.client.timeout, proxies=self.client.proxies, **kwargs
+            )
+            response.raise_for_status()
+            return response
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.client.metrics.record(RequestMetric(
+                method=method,
+                endpoint=endpoint_template(url),
+                status=response.status_code if response is not None else None,
+                error=error,
+                latency=time.time() - started,
+                bytes_in=len(response.content) if response is not None else 0,
+                bytes_out=len(kwargs.get("data") or b""),
+            ))
+
+    def upload(
+            self, file_id: str, token: str, source_url: str, content_type: str = "video/mp4", upload_id: str = None,
+            on_initiate=None,
+    ):
+        """上传 source_url 指向的文件，返回最后一个请求的 response（包含 X-Ros-Video-Id 等响应头）
+
+        :param upload_id: 可选，之前为这个 file_id 发起过的分片上传，本地没有进度文件时（例如重试的任务被分配到了
+            其他节点）沿用它重新上传所有分片
+        :param on_initiate: 可选，新发起分片上传后以 upload_id 调用，调用方可以把它保存到任务检查点中
+        """
+        cleanup_manifests()
+        source = open_part_source(source_url)
+        try:
+            if source.size <= self.part_size:
+                return self._put_single(file_id, token, source, source_url, content_type)
+            manifest = UploadManifest(file_id, source_url, source.size, self.part_size)
+            if manifest.load():
+                print(f"继续分片上传：file_id={file_id}, 已完成分片 {len(manifest.parts)} 个")
+            elif upload_id:
+                print(f"本地没有分片上传进度，沿用 upload_id 重新上传所有分片：file_id={file_id}")
+                manifest.upload_id = upload_id
+                manifest.save()
+            else:
+                try:
+                    manifest.upload_id = self._initiate(file_id, token, content_type)
+                except (requests.RequestException, ElementTree.ParseError, ValueError) as e:
+                    print(f"上传服务不支持分片上传，改为单次上传：{e}")
+                    return self._put_single(file_id, token, source, source_url, content_type)
+                manifest.save()
+                if on_initiate is not None:
+                    on_initiate(manifest.upload_id)
+            response = self._upload_parts(file_id, token, source, manifest)
+            manifest.remove()
+            return response
+        finally:
+            source.close()
+
+    def _put_single(self, file_id, token, source, source_url, content_type):
+        if isinstance(source, FileSource):
+            with open(source.path, "rb") as f:
+                return self.client._put_file(file_id, token, UploadStream(f, source.size), content_type)
+        with open_upload_stream(source_url) as body:
+            return self.client._put_file(file_id, token, body, content_type)
+
+    def _initiate(self, file_id: str, token: str, content_type: str) -> str:
+        response = self._request(
+            "POST", f"{self.upload_host}{file_id}?uploads", token, headers={"Content-Type": content_type}
+        )
+        upload_id = ElementTree.fromstring(response.content).findtext(".//{*}UploadId")
+        if not upload_id:
+            raise ValueError(f"没有返回 UploadId：{response.text}")
+        return upload_id
+
+    def _upload_part(self, file_id: str, token: str, source, manifest: UploadManifest, number: int):
+        offset = (number - 1) * self.part_size
+        length = min(self.part_size, source.size - offset)
+        url = f"{self.upload_host}{file_id}?partNumber={number}&uploadId={manifest.upload_id}"
+        for attempt in range(self.part_retries + 1):
+            try:
+                data = source.read(offset, length)
+                response = self._request("PUT", url, token, data=data)
+                manifest.complete_part(number, response.headers["ETag"])
+                return
+            except Exception as e:
+                if attempt >= self.part_retries:
+                    raise Exception(f"分片 {number} 上传失败：{e}")
+                wait = 2 ** attempt
+                print(f"分片 {number} 上传失败，{wait} 秒后重试：{e}")
+                time.sleep(wait)
+
+    def _upload_parts(self, file_id: str, token: str, source, manifest: UploadManifest):
+        part_count = (source.size + self.part_size - 1) // self.part_size
+        pending = [number for number in range(1, part_count + 1) if number not in manifest.parts]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(self._upload_part, file_id, token, source, manifest, number) for number in pending
+            ]
+            for future in futures:
+                future.result()
+
+        parts = "".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>{manifest.parts[number]}</ETag></Part>"
+            for number in range(1, part_count + 1)
+        )
+        return self._request(
+            "POST",
+            f"{self.upload_host}{file_id}?uploadId={manifest.upload_id}",
+            token,
+            data=f"<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>".encode("utf-8"),
+            headers={"Content-Type": "application/xml"},
+        )
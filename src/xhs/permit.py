@@ -0,0 +1,76 @@
+import threading
+import time
+from typing import NamedTuple
+
+# 接口没有返回过期时间时，认为上传许可在多少秒内有效
+DEFAULT_PERMIT_TTL = 600
+# 距离过期不足多少秒的许可不再发放，留出下载和上传的时间
+PERMIT_EXPIRE_MARGIN = 120
+
+
+class UploadPermit(NamedTuple):
+    file_id: str
+    token: str
+    # 过期时间，time.time() 时间戳（秒）
+    expire_at: float
+
+
+def parse_upload_permits(temp_permits: list) -> list:
+    """把 permit 接口返回的 uploadTempPermits 展开为每个文件 id 一个 UploadPermit"""
+    now = time.time()
+    permits = []
+    for temp_permit in temp_permits:
+        expire_at = temp_permit.get("expireTime")
+        if expire_at:
+            expire_at = float(expire_at)
+            # 兼容毫秒时间戳
+            if expire_at > 1e12:
+                expire_at /= 1000
+        else:
+            expire_at = now + DEFAULT_PERMIT_TTL
+        for file_id in temp_permit["fileIds"]:
+            permits.append(UploadPermit(file_id, temp_permit["token"], expire_at))
+    return permits
+
+
+class UploadPermitPool:
+    """单个账号、单种文件类型的上传许可池
+
+    不够用时一次性批量申请，多出来的许可留给后续上传使用，直到快要过期时丢弃。
+    """
+
+    def __init__(self, client, file_type: str, batch_size: int = 9, margin: float = PERMIT_EXPIRE_MARGIN):
+        """
+        :param client: XhsClient
+        :param file_type: 文件类型，["image", "video"]
+        :param batch_size: 每次至少申请多少个许可
+        :param margin: 距离过期不足多少秒的许可不再发放
+        """
+        self.client = client
+        self.file_type = file_type
+        self.batch_size = batch_size
+        self.margin = margin
+        self._permits = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> UploadPermit:
+        return self.acquire_many(1)[0]
+
+    def acquire_many(self, count: int) -> list:
+        if count <= 0:
+            return []
+        with self._lock:
+            deadline = time.time() + self.margin
+            self._permits = [permit for permit in self._permits if permit.expire_at > deadline]
+            missing = count - len(self._permits)
+            if missing > 0:
+                self._permits.extend(
+                    self.client.get_upload_files_permits(self.file_type, max(missing, self.batch_size))
+                )
+                if len(self._permits) < count:
+                    raise Exception(f"获取上传许可失败：需要 {count} 个，只拿到 {len(self._permits)} 个")
+            permits, self._permits = self._permits[:count], self._permits[count:]
+        return permits
+
+    def __len__(self):
+        return len(self._permits)
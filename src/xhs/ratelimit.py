@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+
+from .metrics import get_metrics
+
+# 每个账号初始 / 最低 / 最高的请求速率（次/秒）
+ACCOUNT_RATE = float(os.environ.get("XHS_ACCOUNT_RATE", 1))
+ACCOUNT_MIN_RATE = float(os.environ.get("XHS_ACCOUNT_MIN_RATE", 0.1))
+ACCOUNT_MAX_RATE = float(os.environ.get("XHS_ACCOUNT_MAX_RATE", 5))
+# 每个出口 IP（代理）初始 / 最低 / 最高的请求速率（次/秒）
+EGRESS_RATE = float(os.environ.get("XHS_EGRESS_RATE", 2))
+EGRESS_MIN_RATE = float(os.environ.get("XHS_EGRESS_MIN_RATE", 0.2))
+EGRESS_MAX_RATE = float(os.environ.get("XHS_EGRESS_MAX_RATE", 10))
+# 需要限速的读取 / 抓取类接口，发布流程中的上传许可、话题搜索和发布笔记等接口不经过限速器
+CRAWL_PATHS = (
+    "/api/sns/web/v1/feed",
+    "/api/sns/web/v1/homefeed",
+    "/api/sns/web/v1/search/notes",
+    "/api/sns/web/v1/user_posted",
+    "/api/sns/web/v1/user/otherinfo",
+    "/api/sns/web/v2/comment/page",
+    "/api/sns/web/v2/comment/sub/page",
+)
+
+
+class AIMDTokenBucket:
+    """按 AIMD 调整速率的令牌桶
+
+    每次请求成功速率增加 increase（加性增），被限流（IPBlockError / SignError）时速率乘以 decrease（乘性减），
+    并清空令牌，cooldown 秒内不再提速。同一批并发请求同时被限流时，1 秒内只降速一次。
+    """
+
+    def __init__(
+            self,
+            rate: float,
+            min_rate: float,
+            max_rate: float,
+            increase: float = 0.05,
+            decrease: float = 0.5,
+            burst: float = 2,
+            cooldown: float = 30,
+    ):
+        """
+        :param rate: 初始速率（次/秒）
+        :param min_rate: 最低速率
+        :param max_rate: 最高速率
+        :param increase: 每次成功增加的速率
+        :param decrease: 被限流时速率乘以的系数
+        :param burst: 令牌桶容量，空闲后最多允许连续发出多少个请求
+        :param cooldown: 被限流后多少秒内不提速
+        """
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self.cooldown = cooldown
+        self.tokens = 1.0
+        self.successes = 0
+        self.throttles = 0
+        self._updated = time.monotonic()
+        self._throttled_at = None
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """等待拿到一个令牌，返回等待的秒数"""
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return now - started
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.successes += 1
+            now = time.monotonic()
+            if self._throttled_at is None or now - self._throttled_at >= self.cooldown:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttles += 1
+            now = time.monotonic()
+            if self._throttled_at is not None and now - self._throttled_at < 1:
+                return
+            self._throttled_at = now
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, 0)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "rate": round(self.rate, 3),
+                "tokens": round(self.tokens, 3),
+                "successes": self.successes,
+                "throttles": self.throttles,
+            }
+
+
+class RateLimiter:
+    """按账号和出口 IP 分别限速，一个请求需要同时拿到账号和出口两个令牌桶的令牌
+
+    只对 paths 中的读取 / 抓取类接口限速，其他接口（发布流程）直接放行。
+    账号以 cookie 中的 a1 区分，出口以代理地址区分（不使用代理时为 direct）。
+    各令牌桶的当前速率以 xhs_rate_limit 指标写入 metrics。
+    """
+
+    def __init__(
+            self,
+            account_rate: tuple = (ACCOUNT_RATE, ACCOUNT_MIN_RATE, ACCOUNT_MAX_RATE),
+            egress_rate: tuple = (EGRESS_RATE, EGRESS_MIN_RATE, EGRESS_MAX_RATE),
+            metrics=None,
+            paths: tuple = CRAWL_PATHS,
+            **bucket_kwargs
+    ):
+        """
+        :param account_rate: 每个账号的 (初始速率, 最低速率, 最高速率)
+        :param egress_rate: 每个出口的 (初始速率, 最低速率, 最高速率)
+        :param metrics: 可选，MetricsSink，默认使用进程内共享的 InMemoryMetrics
+        :param paths: 需要限速的接口路径前缀，None 表示所有接口都限速
+        :param bucket_kwargs: AIMDTokenBucket 的其他参数
+        """
+        self.rates = {"account": account_rate, "egress": egress_rate}
+        self.metrics = get_metrics() if metrics is None else metrics
+        self.paths = paths
+        self.bucket_kwargs = bucket_kwargs
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def limits(self, path: str) -> bool:
+        """该接口是否需要限速"""
+        return self.paths is None or any(path.startswith(prefix) for prefix in self.paths)
+
+    @staticmethod
+    def keys(account: str, proxies: dict = None) -> tuple:
+        egress = (proxies or {}).get("https") or (proxies or {}).get("http") or "direct"
+        return f"account:{account}", f"egress:{egress}"
+
+    def bucket(self, key: str) -> AIMDTokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                rate, min_rate, max_rate = self.rates[key.split(":", 1)[0]]
+                bucket = self._buckets[key] = AIMDTokenBucket(rate, min_rate, max_rate, **self.bucket_kwargs)
+            return bucket
+
+    def acquire(self, keys: tuple) -> float:
+        """依次拿到每个 key 的令牌，返回总共等待的秒数"""
+        return sum(self.bucket(key).acquire() for key in keys)
+
+    def record(self, keys: tuple, throttled: bool):
+        for key in keys:
+            bucket = self.bucket(key)
+            if throttled:
+                bucket.on_throttle()
+            else:
+                bucket.on_success()
+            self.metrics.set_gauge("xhs_rate_limit", key, bucket.rate)
+
+    def stats(self) -> dict:
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {key: bucket.to_dict() for key, bucket in buckets.items()}
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """进程内所有 XhsClient 默认共用的限速器，同一个出口的多个账号共享出口的速率"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
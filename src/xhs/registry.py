@@ -0,0 +1,99 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .core import XhsClient
+from .help import cookie_str_to_cookie_dict
+
+# 最多缓存多少个账号的客户端，超出后淘汰最久未使用的
+CLIENT_REGISTRY_SIZE = int(os.environ.get("XHS_CLIENT_REGISTRY_SIZE", 64))
+# 客户端空闲超过多少秒后关闭连接并淘汰
+CLIENT_IDLE_TTL = float(os.environ.get("XHS_CLIENT_IDLE_TTL", 900))
+# 每个客户端对每个域名最多保持的连接数
+CLIENT_POOL_MAXSIZE = int(os.environ.get("XHS_CLIENT_POOL_MAXSIZE", 10))
+
+
+class ClientEntry:
+    def __init__(self, cookie: str, client: XhsClient):
+        self.cookie = cookie
+        self.client = client
+        self.last_used = time.monotonic()
+
+
+class XhsClientRegistry:
+    """按账号复用 XhsClient，同一账号的连续任务共用已经建立好的 keep-alive 连接
+
+    账号以 cookie 中的 a1 区分，cookie 内容变化（例如重新登录）时旧客户端作废并重新创建。
+    """
+
+    def __init__(
+            self,
+            max_size: int = CLIENT_REGISTRY_SIZE,
+            idle_ttl: float = CLIENT_IDLE_TTL,
+            pool_maxsize: int = CLIENT_POOL_MAXSIZE,
+            **client_kwargs
+    ):
+        """
+        :param client_kwargs: 创建 XhsClient 的其他参数，例如 sign、sign_strategy、proxies
+        """
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.client_kwargs = dict(client_kwargs, pool_maxsize=pool_maxsize)
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def credential_key(cookie: str) -> str:
+        a1 = cookie_str_to_cookie_dict(cookie).get("a1") if cookie else None
+        if a1:
+            return a1
+        return "cookie:" + hashlib.md5((cookie or "").encode("utf-8")).hexdigest()
+
+    def get(self, cookie: str) -> XhsClient:
+        key = self.credential_key(cookie)
+        expired = []
+        created = False
+        with self._lock:
+            now = time.monotonic()
+            for k, entry in list(self._clients.items()):
+                if now - entry.last_used > self.idle_ttl:
+                    expired.append(self._clients.pop(k))
+
+            entry = self._clients.get(key)
+            if entry is not None and entry.cookie != cookie:
+                print(f"账号 cookie 已变化，重新创建客户端：{key}")
+                expired.append(self._clients.pop(key))
+                entry = None
+            if entry is None:
+                entry = ClientEntry(cookie, XhsClient(cookie, **self.client_kwargs))
+                self._clients[key] = entry
+                created = True
+                while len(self._clients) > self.max_size:
+                    expired.append(self._clients.popitem(last=False)[1])
+            self._clients.move_to_end(key)
+            entry.last_used = now
+            client = entry.client
+
+        for entry in expired:
+            entry.client.close()
+        if created:
+            self._warm_signer(client)
+        return client
+
+    def _warm_signer(self, client: XhsClient):
+        """新账号的客户端创建后，让签名器在后台提前为它打开页面，任务发出第一个签名请求时不用再等页面加载"""
+        warm = getattr(self.client_kwargs.get("sign"), "warm", None)
+        if warm is None:
+            return
+        warm([(client.cookie_dict.get("a1", ""), client.cookie_dict.get("web_session", ""))])
+
+    def invalidate(self, cookie: str):
+        with self._lock:
+            entry = self._clients.pop(self.credential_key(cookie), None)
+        if entry is not None:
+            entry.client.close()
+
+    def __len__(self):
+        return len(self._clients)
@@ -0,0 +1,175 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+
+from .exception import CircuitOpenError, DataFetchError, IPBlockError, NeedBindPhoneError, SignError
+
+# 单个接口调用最多尝试几次（包括第一次）
+RETRY_ATTEMPTS = int(os.environ.get("XHS_RETRY_ATTEMPTS", 3))
+# 重试等待时间的基数和上限（秒），第 n 次重试在 [0, min(上限, 基数 * 2^(n-1))] 之间随机
+RETRY_BASE_DELAY = float(os.environ.get("XHS_RETRY_BASE_DELAY", 0.5))
+RETRY_MAX_DELAY = float(os.environ.get("XHS_RETRY_MAX_DELAY", 8))
+# 一个账号在 CIRCUIT_WINDOW 秒内被封 IP CIRCUIT_THRESHOLD 次后暂停 CIRCUIT_OPEN_SECONDS 秒
+CIRCUIT_THRESHOLD = int(os.environ.get("XHS_CIRCUIT_THRESHOLD", 3))
+CIRCUIT_WINDOW = float(os.environ.get("XHS_CIRCUIT_WINDOW", 60))
+CIRCUIT_OPEN_SECONDS = float(os.environ.get("XHS_CIRCUIT_OPEN_SECONDS", 120))
+
+# 请求可能已经被服务端处理的传输错误，只有幂等的请求可以重试
+TRANSPORT_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError, ValueError)
+
+
+class CircuitBreaker:
+    """单个账号的熔断器
+
+    短时间内多次 IPBlockError 后打开，打开期间的请求直接抛出 CircuitOpenError；
+    到期后只放行一个试探请求，成功则关闭，再次被封 IP 则重新打开。
+    """
+
+    def __init__(self, threshold: int = CIRCUIT_THRESHOLD, window: float = CIRCUIT_WINDOW,
+                 open_seconds: float = CIRCUIT_OPEN_SECONDS):
+        self.threshold = threshold
+        self.window = window
+        self.open_seconds = open_seconds
+        self.opened_at = None
+        self._blocks = deque()
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.open_seconds - time.time()
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError(f"账号多次被限制访问，暂停请求，{max(remaining, 0):.0f} 秒后重试")
+            self._probing = True
+
+    def on_success(self):
+        with self._lock:
+            self.opened_at = None
+            self._blocks.clear()
+            self._probing = False
+
+    def on_ip_block(self):
+        with self._lock:
+            now = time.time()
+            self._blocks.append(now)
+            while self._blocks and now - self._blocks[0] > self.window:
+                self._blocks.popleft()
+            if self._probing or len(self._blocks) >= self.threshold:
+                if self.opened_at is None or self._probing:
+                    print(f"账号短时间内多次被限制访问，暂停请求 {self.open_seconds:g} 秒")
+                self.opened_at = now
+            self._probing = False
+
+    def release(self):
+        """请求因为其他原因失败，不改变熔断状态"""
+        with self._lock:
+            self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+
+class RetryEngine:
+    """接口调用的重试和按账号熔断
+
+    - NeedBindPhoneError、DataFetchError 等业务错误不重试
+    - SignError 重试，每次重试都会重新计算签名
+    - IPBlockError 重试，计入熔断器，等待时间是普通重试的 4 倍
+    - 连接失败、超时等传输错误只有幂等的请求重试；连接超时时请求还没有发出，总是可以重试
+    """
+
+    def __init__(
+            self,
+            attempts: int = RETRY_ATTEMPTS,
+            base_delay: float = RETRY_BASE_DELAY,
+            max_delay: float = RETRY_MAX_DELAY,
+            **breaker_kwargs
+    ):
+        """
+        :param attempts: 最多尝试几次（包括第一次）
+        :param base_delay: 重试等待时间的基数（秒）
+        :param max_delay: 重试等待时间的上限（秒）
+        :param breaker_kwargs: CircuitBreaker 的参数
+        """
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker_kwargs = breaker_kwargs
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, account: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(account)
+            if breaker is None:
+                breaker = self._breakers[account] = CircuitBreaker(**self.breaker_kwargs)
+            return breaker
+
+    @staticmethod
+    def retryable(error: Exception, idempotent: bool) -> bool:
+        if isinstance(error, (NeedBindPhoneError, DataFetchError, CircuitOpenError)):
+            return False
+        if isinstance(error, (SignError, IPBlockError, requests.ConnectTimeout)):
+            return True
+        return idempotent and isinstance(error, TRANSPORT_ERRORS)
+
+    def delay(self, attempt: int, error: Exception) -> float:
+        base = self.base_delay * (4 if isinstance(error, IPBlockError) else 1)
+        return random.uniform(0, min(self.max_delay, base * 2 ** (attempt - 1)))
+
+    def call(self, account: str, func, idempotent: bool = False, description: str = ""):
+        """调用 func()，按错误类型重试
+
+        :param account: 账号标识，每个账号一个熔断器
+        :param idempotent: 请求是否幂等，决定传输错误能否重试
+        :param description: 打印日志时使用的描述，例如 GET /api/sns/web/v1/feed
+        """
+        breaker = self.breaker(account)
+        attempt = 0
+        while True:
+            breaker.before_call()
+            attempt += 1
+            try:
+                result = func()
+            except IPBlockError as e:
+                breaker.on_ip_block()
+                error = e
+            except (DataFetchError, NeedBindPhoneError):
+                # 业务错误说明请求已经被服务端正常处理
+                breaker.on_success()
+                raise
+            except Exception as e:
+                breaker.release()
+                error = e
+            else:
+                breaker.on_success()
+                return result
+
+            if attempt >= self.attempts or not self.retryable(error, idempotent):
+                raise error
+            if breaker.is_open:
+                # 熔断器刚刚打开，不再等待，下一轮直接抛出 CircuitOpenError
+                continue
+            delay = self.delay(attempt, error)
+            print(f"请求失败，{delay:.1f} 秒后第 {attempt} 次重试：{description} {type(error).__name__}: {error}")
+            time.sleep(delay)
+
+
+_retry_engine = None
+_retry_engine_lock = threading.Lock()
+
+
+def get_retry_engine() -> RetryEngine:
+    """进程内所有 XhsClient 默认共用的重试引擎，同一账号的多个客户端共用一个熔断器"""
+    global _retry_engine
+    with _retry_engine_lock:
+        if _retry_engine is None:
+            _retry_engine = RetryEngine()
+        return _retry_engine
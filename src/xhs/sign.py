@@ -1,44 +1,539 @@
-from playwright.sync_api import sync_playwright
+import asyncio
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from playwright.async_api import async_playwright
 from .utils import get_statics_folder
 
+XHS_HOME = "https://www.xiaohongshu.com"
 
-def sign(uri, data=None, a1="", web_session=""):
-    err_msg = ""
-    max_tries = 5
-    tried = 0
-    for i in range(max_tries):
-        try:
-            tried += 1
-            with sync_playwright() as playwright:
-                stealth_js_folder = get_statics_folder()
-                stealth_js_path = f"{stealth_js_folder}/stealth.min.js"
-                print(f"Load stealth.min.js at {stealth_js_path}")
-                chromium = playwright.chromium
-
-                # 如果一直失败可尝试设置成 False 让其打开浏览器，适当添加 sleep 可查看浏览器状态
-                browser = chromium.launch(headless=True)
-
-                browser_context = browser.new_context()
-                browser_context.add_init_script(path=stealth_js_path)
-                context_page = browser_context.new_page()
-                context_page.goto("https://www.xiaohongshu.com")
-                browser_context.add_cookies([
-                    {'name': 'a1', 'value': a1, 'domain': ".xiaohongshu.com", 'path': "/"}]
+# 签名页面池大小，即最多同时保留多少个账号的 browser context，超出后按 LRU 淘汰空闲的 context
+SIGN_POOL_SIZE = int(os.environ.get("XHS_SIGN_POOL_SIZE", 16))
+# 单个页面最多签名多少次后回收重建，避免页面长时间运行内存膨胀或状态异常
+SIGN_PAGE_MAX_USES = int(os.environ.get("XHS_SIGN_PAGE_MAX_USES", 500))
+# 账号的 context 空闲超过多少秒后关闭
+SIGN_CONTEXT_IDLE_TTL = float(os.environ.get("XHS_SIGN_CONTEXT_IDLE_TTL", 600))
+# 所有签名页面 JS 堆内存之和的上限（MB），超出后按 LRU 淘汰空闲的 context，0 表示不限制
+SIGN_MAX_MEMORY_MB = float(os.environ.get("XHS_SIGN_MAX_MEMORY_MB", 1024))
+# 单次签名等待的最长时间（秒），包括等待空闲页面
+SIGN_TIMEOUT = float(os.environ.get("XHS_SIGN_TIMEOUT", 60))
+# 签名页面是否拦截图片、字体、媒体等与签名无关的资源，并从本地缓存加载 JS
+SIGN_BLOCK_RESOURCES = os.environ.get("XHS_SIGN_BLOCK_RESOURCES", "1") == "1"
+# 本地缓存的 JS 资源多少秒后重新从线上拉取
+SIGN_ASSET_TTL = float(os.environ.get("XHS_SIGN_ASSET_TTL", 6 * 3600))
+# 浏览器启动后是否立即打开一个不带账号的默认页面，提前加载好签名 JS 并写入本地资源缓存
+SIGN_WARM_ON_START = os.environ.get("XHS_SIGN_WARM_ON_START", "1") == "1"
+
+# 预热用的默认页面，不设置账号 cookie
+DEFAULT_SIGN_KEY = ("", "")
+
+# 签名只需要页面上定义 window._webmsxyw 的 JS，其余资源直接拦截
+BLOCKED_RESOURCE_TYPES = {
+    "image", "media", "font", "stylesheet", "texttrack", "manifest", "ping", "websocket", "eventsource", "other"
+}
+
+# 缓存签名页面 JS 时不保存的响应头
+HOP_BY_HOP_HEADERS = {"content-length", "content-encoding", "transfer-encoding", "connection"}
+
+# 检查 window._webmsxyw 是否就绪并批量签名，只需要一次 page.evaluate
+SIGN_SCRIPT = """(requests) => typeof window._webmsxyw === 'function'
+    ? requests.map(([url, data]) => window._webmsxyw(url, data))
+    : null"""
+
+
+class SignAssetCache:
+    """签名页面 JS 资源的本地磁盘缓存，存放在 statics/sign-cache 下，按 URL 区分版本
+
+    响应头和内容保存在同一个文件中（第一行为响应头 JSON，其后为内容），命中时原样返回，
+    跨域加载的脚本需要其中的 Access-Control-Allow-Origin 等响应头。
+    超过 ttl 的资源会在下次请求时重新拉取，拉取失败时继续使用旧的缓存。
+    多个进程可能同时写同一个文件，写入先落到临时文件再原子替换。
+    """
+
+    def __init__(self, folder: str, ttl: float = SIGN_ASSET_TTL):
+        self.folder = folder
+        self.ttl = ttl
+        self._last_cleanup = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, url: str):
+        return os.path.join(self.folder, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".js")
+
+    def get(self, url: str, allow_stale: bool = False):
+        """返回 (body, headers)，没有缓存或已过期时返回 None"""
+        path = self._path(url)
+        try:
+            if not allow_stale and time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, "rb") as f:
+                headers = json.loads(f.readline())
+                if not isinstance(headers, dict):
+                    # 旧版本只有内容、没有响应头的缓存文件
+                    return None
+                return f.read(), headers
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url: str, body: bytes, headers: dict):
+        path = self._path(url)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # 响应头和内容写在同一个文件里一次替换，读取方不会拿到新旧版本混在一起的响应头和内容
+            with open(tmp_path, "wb") as f:
+                f.write(json.dumps(headers).encode("utf-8") + b"\n")
+                f.write(body)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            print(f"写入签名资源缓存失败：{e}")
+
+    def cleanup(self):
+        """删除长时间没有被刷新过的资源，一般是线上已经不再引用的旧版本 JS"""
+        now = time.time()
+        if now - self._last_cleanup < self.ttl:
+            return
+        self._last_cleanup = now
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl * 4:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+class SignPage:
+    """签名池中的一个页面，每个账号（a1 + web_session）独占一个 browser context，cookie 设置好后一直复用"""
+
+    def __init__(self, key: tuple):
+        self.key = key
+        self.a1, self.web_session = key
+        self.context = None
+        self.page = None
+        self.uses = 0
+        self.busy = False
+        self.heap_bytes = 0
+        self.last_used = time.monotonic()
+
+
+class BrowserSigner:
+    """常驻的 Playwright 签名器
+
+    浏览器只启动一次，并按账号缓存已经设置好 cookie、window._webmsxyw 已经就绪的页面，
+    同一个账号连续签名时不再需要重新加载页面。缓存有 LRU 数量上限、空闲过期时间和内存上限。
+    Playwright 的对象只能在创建它的线程中使用，因此所有浏览器操作都在一个后台事件循环线程中执行，
+    调用方线程通过 sign() 提交任务并等待结果，可以被多个线程同时调用。
+    """
+
+    def __init__(
+            self,
+            pool_size: int = SIGN_POOL_SIZE,
+            max_uses: int = SIGN_PAGE_MAX_USES,
+            idle_ttl: float = SIGN_CONTEXT_IDLE_TTL,
+            max_memory_mb: float = SIGN_MAX_MEMORY_MB,
+            timeout: float = SIGN_TIMEOUT,
+            max_tries: int = 5,
+            headless: bool = True,
+            block_resources: bool = SIGN_BLOCK_RESOURCES,
+            warm_on_start: bool = SIGN_WARM_ON_START,
+    ):
+        self.pool_size = max(1, pool_size)
+        self.max_uses = max_uses
+        self.idle_ttl = idle_ttl
+        self.max_memory_bytes = max_memory_mb * 1024 * 1024
+        self.timeout = timeout
+        self.max_tries = max_tries
+        # 如果一直失败可尝试设置成 False 让其打开浏览器查看状态
+        self.headless = headless
+        self.stealth_js_path = os.path.join(get_statics_folder(), "stealth.min.js")
+        self.block_resources = block_resources
+        self.asset_cache = SignAssetCache(os.path.join(get_statics_folder(), "sign-cache")) if block_resources else None
+        self.warm_on_start = warm_on_start
+
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._playwright = None
+        self._browser = None
+        self._sweeper = None
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        # 以下属性只在事件循环线程中访问，按最近使用时间排序
+        self._pages = OrderedDict()
+        self._cond = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="xhs-signer", daemon=True)
+            thread.start()
+            try:
+                asyncio.run_coroutine_threadsafe(self._launch(), loop).result(self.timeout)
+            except Exception:
+                loop.call_soon_threadsafe(loop.stop)
+                raise
+            self._loop, self._thread = loop, thread
+            # 页面池只有一个位置时，预热页面会占住它，第一个真正的签名还要先淘汰它
+            if self.warm_on_start and self.pool_size > 1:
+                asyncio.run_coroutine_threadsafe(self._warm([DEFAULT_SIGN_KEY]), loop)
+        atexit.register(self.close)
+
+    def warm(self, accounts: list, wait: bool = False):
+        """在后台提前为账号创建好 context 和页面，之后的签名直接复用；已经存在的页面只刷新最近使用时间
+
+        :param accounts: [(a1, web_session), ...]，超出页面池大小的部分不预热
+        :param wait: 是否等待预热完成，默认在后台线程中启动浏览器和打开页面，不阻塞调用方
+        """
+        keys = list(dict.fromkeys((a1 or "", web_session or "") for a1, web_session in accounts))[:self.pool_size]
+
+        def run():
+            try:
+                self.start()
+                asyncio.run_coroutine_threadsafe(self._warm(keys), self._loop).result(self.timeout)
+            except Exception as e:
+                print(f"预热签名页面失败：{e}")
+
+        if wait:
+            run()
+        else:
+            threading.Thread(target=run, name="xhs-signer-warm", daemon=True).start()
+
+    def close(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            loop, thread = self._loop, self._thread
+            self._loop, self._thread = None, None
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(self.timeout)
+        except Exception as e:
+            print(f"关闭签名浏览器失败：{e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(self.timeout)
+
+    def sign(self, uri, data=None, a1="", web_session=""):
+        return self.sign_many([(uri, data)], a1=a1, web_session=web_session)[0]
+
+    __call__ = sign
+
+    def sign_many(self, requests: list, a1="", web_session="") -> list:
+        """同一个账号的多个请求在一次 page.evaluate 中完成签名，返回结果与 requests 顺序一致
+
+        :param requests: [(uri, data), ...]
+        """
+        return self.sign_batch(
+            [{"uri": uri, "data": data, "a1": a1, "web_session": web_session} for uri, data in requests]
+        )
+
+    def sign_batch(self, items: list) -> list:
+        """批量签名，按账号分组，每个账号的请求在一次 page.evaluate 中完成，各账号之间并发执行，
+        返回结果与 items 顺序一致
+
+        :param items: [{"uri": "", "data": None, "a1": "", "web_session": ""}, ...]
+        """
+        self.start()
+        groups = {}
+        for index, item in enumerate(items):
+            key = (item.get("a1") or "", item.get("web_session") or "")
+            groups.setdefault(key, []).append(index)
+
+        with self._pending_lock:
+            self._pending += len(items)
+        try:
+            futures = {}
+            for key, indexes in groups.items():
+                requests = [(items[i]["uri"], items[i].get("data")) for i in indexes]
+                futures[key] = (requests, self._submit(key, requests))
+            results = [None] * len(items)
+            for key, (requests, future) in futures.items():
+                for index, encrypt_params in zip(groups[key], self._wait(key, requests, future)):
+                    results[index] = {
+                        "x-s": encrypt_params["X-s"],
+                        "x-t": str(encrypt_params["X-t"])
+                    }
+            return results
+        finally:
+            with self._pending_lock:
+                self._pending -= len(items)
+
+    def stats(self) -> dict:
+        """签名器当前状态，pending 为正在排队或执行中的签名请求数量"""
+        stats = {"pending": self._pending, "pool_size": self.pool_size, "contexts": 0, "busy": 0}
+        loop = self._loop
+        if loop is not None:
+            stats.update(asyncio.run_coroutine_threadsafe(self._stats(), loop).result(self.timeout))
+        return stats
+
+    def _submit(self, key: tuple, requests: list):
+        return asyncio.run_coroutine_threadsafe(self._sign(requests, key), self._loop)
+
+    def _wait(self, key: tuple, requests: list, future) -> list:
+        err_msg = ""
+        for tried in range(self.max_tries):
+            if tried > 0:
+                future = self._submit(key, requests)
+            try:
+                return future.result(self.timeout)
+            except Exception as e:
+                # 这儿有时会出现 window._webmsxyw is not a function 或未知跳转错误，出错的页面会被回收，重建后重试
+                future.cancel()
+                err_msg = str(e) or type(e).__name__
+                print(f"签名失败，准备重试：{err_msg}")
+        raise Exception(f"签名失败: {err_msg}")
+
+    async def _launch(self):
+        print(f"启动签名浏览器，页面池大小 {self.pool_size}，加载 stealth.min.js：{self.stealth_js_path}")
+        self._cond = asyncio.Condition()
+        self._playwright = await async_playwright().start()
+        # 开启精确的 performance.memory，用于统计每个页面的内存占用
+        self._browser = await self._playwright.chromium.launch(
+            headless=self.headless, args=["--enable-precise-memory-info"]
+        )
+        self._sweeper = asyncio.ensure_future(self._sweep_loop())
+
+    async def _warm(self, keys: list):
+        async def open_one(key):
+            sign_page = await self._acquire(key)
+            await self._release(sign_page)
+
+        results = await asyncio.gather(*(open_one(key) for key in keys), return_exceptions=True)
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                print(f"预热签名页面失败：a1={key[0]}, {result}")
+
+    async def _stats(self):
+        async with self._cond:
+            return {
+                "contexts": len(self._pages),
+                "busy": sum(1 for p in self._pages.values() if p.busy),
+            }
+
+    async def _shutdown(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+        for sign_page in list(self._pages.values()):
+            await self._close_page(sign_page)
+        self._pages.clear()
+        if self._browser:
+            await self._browser.close()
+        if self._playwright:
+            await self._playwright.stop()
+
+    async def _open_page(self, sign_page: SignPage):
+        context = await self._browser.new_context()
+        try:
+            await context.add_init_script(path=self.stealth_js_path)
+            if self.block_resources:
+                await context.route("**/*", self._route)
+            # 在打开首页之前设置好 cookie，这样只需要加载一次页面；预热用的默认页面不设置
+            cookies = []
+            if sign_page.a1:
+                cookies.append({'name': 'a1', 'value': sign_page.a1, 'domain': ".xiaohongshu.com", 'path': "/"})
+            if sign_page.web_session:
+                cookies.append(
+                    {'name': 'web_session', 'value': sign_page.web_session, 'domain': ".xiaohongshu.com", 'path': "/"}
                 )
-                context_page.reload()
-                context_page.wait_for_load_state()
-                # # 这个地方设置完浏览器 cookie 之后，如果这儿不 sleep 一下签名获取就失败了，如果经常失败请设置长一点试试
-                # sleep(5)
-                print("开始计算签名")
-                encrypt_params = context_page.evaluate("([url, data]) => window._webmsxyw(url, data)", [uri, data])
-                print("签名结果：", encrypt_params)
-                return {
-                    "x-s": encrypt_params["X-s"],
-                    "x-t": str(encrypt_params["X-t"])
+            if cookies:
+                await context.add_cookies(cookies)
+            page = await context.new_page()
+            await page.goto(XHS_HOME)
+            await page.wait_for_load_state()
+        except BaseException:
+            await context.close()
+            raise
+        sign_page.context, sign_page.page = context, page
+
+    async def _route(self, route):
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES:
+            await route.abort()
+            return
+        if request.resource_type != "script" or request.method != "GET":
+            await route.continue_()
+            return
+
+        url = request.url
+        cached = self.asset_cache.get(url)
+        if cached is None:
+            try:
+                response = await route.fetch()
+                if response.status != 200:
+                    await route.fulfill(response=response)
+                    return
+                # body() 返回的是解压后的内容，长度和压缩方式相关的响应头不能再原样返回
+                headers = {
+                    name: value for name, value in response.headers.items()
+                    if name.lower() not in HOP_BY_HOP_HEADERS
                 }
+                cached = await response.body(), headers
+                self.asset_cache.put(url, *cached)
+            except Exception as e:
+                cached = self.asset_cache.get(url, allow_stale=True)
+                if cached is None:
+                    print(f"加载签名页面资源失败：{url}, {e}")
+                    await route.abort()
+                    return
+        body, headers = cached
+        await route.fulfill(status=200, headers=headers, body=body)
+
+    async def _close_page(self, sign_page: SignPage):
+        if sign_page.context is None:
+            return
+        try:
+            await sign_page.context.close()
         except Exception as e:
-            print(e)
-            err_msg = str(e)
-            if tried > max_tries:
-                # 这儿有时会出现 window._webmsxyw is not a function 或未知跳转错误，因此加一个失败重试趴
-                raise Exception(f"签名失败: {err_msg}")
+            print(f"关闭签名页面失败：{e}")
+
+    def _pop_lru_idle(self):
+        """取出最久未使用的空闲页面，调用方需持有 self._cond"""
+        for key, sign_page in self._pages.items():
+            if not sign_page.busy:
+                del self._pages[key]
+                return sign_page
+        return None
+
+    async def _acquire(self, key: tuple) -> SignPage:
+        evicted = None
+        async with self._cond:
+            while True:
+                sign_page = self._pages.get(key)
+                if sign_page is not None:
+                    if not sign_page.busy:
+                        sign_page.busy = True
+                        self._pages.move_to_end(key)
+                        return sign_page
+                elif len(self._pages) < self.pool_size:
+                    break
+                else:
+                    evicted = self._pop_lru_idle()
+                    if evicted is not None:
+                        break
+                await self._cond.wait()
+            # 先占住位置，同一个账号的并发请求会等待这个页面创建完成
+            sign_page = SignPage(key)
+            sign_page.busy = True
+            self._pages[key] = sign_page
+        try:
+            if evicted is not None:
+                await self._close_page(evicted)
+            await self._open_page(sign_page)
+        except BaseException:
+            # 包括等待超时后 future.cancel() 引发的 CancelledError，否则占位页面一直处于 busy 状态
+            async with self._cond:
+                self._pages.pop(key, None)
+                self._cond.notify_all()
+            await self._close_page(sign_page)
+            raise
+        return sign_page
+
+    async def _release(self, sign_page: SignPage, broken: bool = False):
+        recycle = broken or sign_page.uses >= self.max_uses
+        async with self._cond:
+            sign_page.busy = False
+            sign_page.last_used = time.monotonic()
+            if recycle and self._pages.get(sign_page.key) is sign_page:
+                del self._pages[sign_page.key]
+            self._cond.notify_all()
+        if recycle:
+            await self._close_page(sign_page)
+
+    async def _sweep_loop(self):
+        interval = max(1.0, min(self.idle_ttl, 60.0))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._sweep()
+                if self.asset_cache:
+                    self.asset_cache.cleanup()
+            except Exception as e:
+                print(f"清理签名页面失败：{e}")
+
+    async def _sweep(self):
+        """关闭空闲过期的 context，并在内存超出上限时按 LRU 淘汰空闲的 context"""
+        now = time.monotonic()
+        evicted = []
+        async with self._cond:
+            for key, sign_page in list(self._pages.items()):
+                if not sign_page.busy and now - sign_page.last_used > self.idle_ttl:
+                    del self._pages[key]
+                    evicted.append(sign_page)
+            idle_pages = [p for p in self._pages.values() if not p.busy and p.page is not None]
+        for sign_page in evicted:
+            await self._close_page(sign_page)
+        evicted = []
+
+        if self.max_memory_bytes > 0:
+            for sign_page in idle_pages:
+                try:
+                    sign_page.heap_bytes = await sign_page.page.evaluate("performance.memory.usedJSHeapSize")
+                except Exception:
+                    pass
+            async with self._cond:
+                total = sum(p.heap_bytes for p in self._pages.values())
+                while total > self.max_memory_bytes:
+                    sign_page = self._pop_lru_idle()
+                    if sign_page is None:
+                        break
+                    total -= sign_page.heap_bytes
+                    evicted.append(sign_page)
+                if evicted:
+                    self._cond.notify_all()
+            for sign_page in evicted:
+                await self._close_page(sign_page)
+        if evicted:
+            print(f"签名页面内存超出上限，淘汰 {len(evicted)} 个空闲账号页面")
+
+    async def _evaluate(self, sign_page: SignPage, requests: list):
+        """在页面中批量签名，window._webmsxyw 未就绪时返回 None，检查和签名在同一次 evaluate 中完成"""
+        if sign_page.page.is_closed():
+            return None
+        return await sign_page.page.evaluate(SIGN_SCRIPT, [[uri, data] for uri, data in requests])
+
+    async def _sign(self, requests: list, key: tuple):
+        sign_page = await self._acquire(key)
+        broken = True
+        try:
+            encrypt_params = await self._evaluate(sign_page, requests)
+            if encrypt_params is None:
+                # 页面可能跳转到了其他地址，重新打开首页再签名一次
+                await sign_page.page.goto(XHS_HOME)
+                await sign_page.page.wait_for_load_state()
+                encrypt_params = await self._evaluate(sign_page, requests)
+                if encrypt_params is None:
+                    raise Exception("window._webmsxyw is not a function")
+            sign_page.uses += len(requests)
+            broken = False
+            return encrypt_params
+        finally:
+            await self._release(sign_page, broken=broken)
+
+
+_default_signer = None
+_default_signer_lock = threading.Lock()
+
+
+def get_signer() -> BrowserSigner:
+    """进程内共享的默认签名器，首次使用时才启动浏览器"""
+    global _default_signer
+    with _default_signer_lock:
+        if _default_signer is None:
+            _default_signer = BrowserSigner()
+        return _default_signer
+
+
+def sign(uri, data=None, a1="", web_session=""):
+    return get_signer().sign(uri, data, a1=a1, web_session=web_session)
+
+
+def sign_many(requests: list, a1="", web_session=""):
+    return get_signer().sign_many(requests, a1=a1, web_session=web_session)
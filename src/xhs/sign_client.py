@@ -0,0 +1,47 @@
+import os
+
+import requests
+
+SIGN_SERVER_URL = os.environ.get("XHS_SIGN_SERVER_URL")
+
+
+class RemoteSigner:
+    """本机签名服务（src.xhs.sign_server）的客户端，可以直接作为 XhsClient 的 sign 参数使用"""
+
+    def __init__(self, base_url: str = None, timeout: float = 60):
+        base_url = base_url or SIGN_SERVER_URL
+        if not base_url:
+            raise Exception("请在环境变量中配置 XHS_SIGN_SERVER_URL")
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def sign(self, uri, data=None, a1="", web_session=""):
+        return self._post("/sign", {"uri": uri, "data": data, "a1": a1, "web_session": web_session})
+
+    __call__ = sign
+
+    def sign_many(self, requests: list, a1="", web_session="") -> list:
+        """同一个账号的多个 (uri, data) 一次请求完成签名，格式同 BrowserSigner.sign_many"""
+        return self.sign_batch(
+            [{"uri": uri, "data": data, "a1": a1, "web_session": web_session} for uri, data in requests]
+        )
+
+    def sign_batch(self, items: list) -> list:
+        """批量签名，一次请求提交多个签名，items 格式同 BrowserSigner.sign_batch"""
+        return self._post("/sign/batch", {"items": items})["results"]
+
+    def stats(self) -> dict:
+        response = self.session.get(f"{self.base_url}/stats", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _post(self, path: str, body: dict):
+        try:
+            response = self.session.post(f"{self.base_url}{path}", json=body, timeout=self.timeout)
+            result = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise Exception(f"签名失败: 无法访问签名服务 {self.base_url}: {e}")
+        if response.status_code != 200:
+            raise Exception(f"签名失败: {result.get('error')}")
+        return result
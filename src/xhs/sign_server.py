@@ -0,0 +1,129 @@
+"""本机共享的签名服务
+
+同一台机器上的所有 worker 进程通过回环地址的 HTTP 请求共用一个浏览器页面池，浏览器只需要启动一次。
+
+启动方式::
+
+    python -m src.xhs.sign_server --host 127.0.0.1 --port 5005
+
+worker 侧配置环境变量 XHS_SIGN_SERVER_URL=http://127.0.0.1:5005 后即改为使用该服务签名。
+"""
+import argparse
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .sign import BrowserSigner
+
+SIGN_SERVER_HOST = os.environ.get("XHS_SIGN_SERVER_HOST", "127.0.0.1")
+SIGN_SERVER_PORT = int(os.environ.get("XHS_SIGN_SERVER_PORT", 5005))
+
+
+class SignRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /sign        {"uri": "", "data": {}, "a1": "", "web_session": ""} -> {"x-s": "", "x-t": ""}
+    POST /sign/batch  {"items": [{"uri": "", ...}, ...]} -> {"results": [{"x-s": "", "x-t": ""}, ...]}
+    GET  /stats       -> 队列深度和页面池状态
+    """
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send(200, self.server.stats())
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self._send(400, {"error": f"invalid json: {e}"})
+            return
+
+        if self.path == "/sign":
+            items = [body]
+        elif self.path == "/sign/batch":
+            items = body.get("items", [])
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+            return
+        if not all(isinstance(item, dict) and item.get("uri") for item in items):
+            self._send(400, {"error": "uri is required"})
+            return
+
+        try:
+            results = self.server.sign_batch(items)
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+            return
+        if self.path == "/sign":
+            self._send(200, results[0])
+        else:
+            self._send(200, {"results": results})
+
+    def _send(self, status: int, data: dict):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # 签名请求非常频繁，不逐条打印访问日志
+        pass
+
+
+class SignServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = SIGN_SERVER_HOST, port: int = SIGN_SERVER_PORT, signer: BrowserSigner = None):
+        super().__init__((host, port), SignRequestHandler)
+        self.signer = signer or BrowserSigner()
+        self._counter_lock = threading.Lock()
+        self.requests = 0
+        self.signed = 0
+        self.failed = 0
+
+    def sign_batch(self, items: list) -> list:
+        with self._counter_lock:
+            self.requests += 1
+        try:
+            results = self.signer.sign_batch(items)
+        except Exception:
+            with self._counter_lock:
+                self.failed += len(items)
+            raise
+        with self._counter_lock:
+            self.signed += len(items)
+        return results
+
+    def stats(self) -> dict:
+        stats = self.signer.stats()
+        with self._counter_lock:
+            stats.update({"requests": self.requests, "signed": self.signed, "failed": self.failed})
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="小红书本机签名服务")
+    parser.add_argument("--host", default=SIGN_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SIGN_SERVER_PORT)
+    args = parser.parse_args()
+
+    server = SignServer(args.host, args.port)
+    # 启动时就拉起浏览器，避免第一个请求承担冷启动
+    server.signer.start()
+    print(f"签名服务已启动：http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.signer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import threading
+from urllib.parse import urlsplit
+
+from .help import sign as local_sign
+
+LOCAL = "local"
+BROWSER = "browser"
+
+# 已确认接受算法签名的接口前缀：创作者发布相关接口（话题、@用户搜索、发布笔记）和上传许可接口，其余接口直接使用浏览器签名
+LOCAL_SIGN_ENDPOINTS = (
+    "/web_api/sns/",
+    "/api/media/v1/upload/",
+)
+
+
+class EndpointSignStats:
+    """单个接口两种签名方式的成功率，使用指数滑动平均，近期结果权重更高"""
+
+    def __init__(self):
+        self.local_attempts = 0
+        self.local_success_rate = 1.0
+        self.browser_attempts = 0
+        self.browser_success_rate = 1.0
+        # 本地签名被降级后，累计使用浏览器签名的次数，用于定期重新试探本地签名
+        self.since_probe = 0
+
+    def to_dict(self):
+        return {
+            "local_attempts": self.local_attempts,
+            "local_success_rate": round(self.local_success_rate, 4),
+            "browser_attempts": self.browser_attempts,
+            "browser_success_rate": round(self.browser_success_rate, 4),
+        }
+
+
+class AdaptiveSignStrategy:
+    """按接口自适应选择签名方式
+
+    endpoints 内的接口优先使用进程内的算法签名（help.sign），不需要经过浏览器，其余接口总是使用浏览器签名；某个接口的算法签名成功率低于阈值后，
+    该接口改用浏览器签名，并每隔 probe_interval 次重新试探一次算法签名，服务端重新接受后自动切回。
+    算法签名的请求返回 SignError 时，由 XhsClient 立即改用浏览器签名重试。
+    """
+
+    def __init__(
+            self,
+            local_sign=local_sign,
+            endpoints: tuple = LOCAL_SIGN_ENDPOINTS,
+            min_samples: int = 5,
+            min_success_rate: float = 0.8,
+            probe_interval: int = 50,
+            alpha: float = 0.1,
+    ):
+        """
+        :param local_sign: 进程内的签名函数，参数同 help.sign
+        :param endpoints: 可选，允许使用算法签名的接口前缀，默认为 LOCAL_SIGN_ENDPOINTS，None 时所有接口都可以尝试
+        :param min_samples: 样本数不足时总是尝试算法签名
+        :param min_success_rate: 算法签名成功率低于该值时改用浏览器签名
+        :param probe_interval: 降级后每隔多少次请求重新试探一次算法签名
+        :param alpha: 滑动平均系数
+        """
+        self.local_sign = local_sign
+        self.endpoints = endpoints
+        self.min_samples = min_samples
+        self.min_success_rate = min_success_rate
+        self.probe_interval = probe_interval
+        self.alpha = alpha
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(uri: str) -> str:
+        return urlsplit(uri).path
+
+    def _allowed(self, endpoint: str) -> bool:
+        return self.endpoints is None or any(endpoint.startswith(prefix) for prefix in self.endpoints)
+
+    def _local_trusted(self, stats: EndpointSignStats) -> bool:
+        return stats.local_attempts < self.min_samples or stats.local_success_rate >= self.min_success_rate
+
+    def prefers_local(self, uri: str) -> bool:
+        """该接口当前是否倾向于使用算法签名，不计入试探次数"""
+        endpoint = self.endpoint(uri)
+        if not self._allowed(endpoint):
+            return False
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            return stats is None or self._local_trusted(stats)
+
+    def choose(self, uri: str) -> str:
+        endpoint = self.endpoint(uri)
+        if not self._allowed(endpoint):
+            return BROWSER
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, EndpointSignStats())
+            if self._local_trusted(stats):
+                return LOCAL
+            stats.since_probe += 1
+            if stats.since_probe >= self.probe_interval:
+                stats.since_probe = 0
+                return LOCAL
+            return BROWSER
+
+    def record(self, uri: str, method: str, ok: bool):
+        endpoint = self.endpoint(uri)
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, EndpointSignStats())
+            if method == LOCAL:
+                stats.local_attempts += 1
+                stats.local_success_rate += self.alpha * (int(ok) - stats.local_success_rate)
+            else:
+                stats.browser_attempts += 1
+                stats.browser_success_rate += self.alpha * (int(ok) - stats.browser_success_rate)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {endpoint: stats.to_dict() for endpoint, stats in self._stats.items()}
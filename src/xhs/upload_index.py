@@ -0,0 +1,87 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# 上传过的素材在多少秒内可以直接复用文件 id
+UPLOAD_DEDUP_TTL = float(os.environ.get("XHS_UPLOAD_DEDUP_TTL", 12 * 3600))
+
+
+class UploadDedupIndex:
+    """上传去重索引，(账号, 文件类型, 内容哈希) -> 已上传文件的信息
+
+    同一账号再次发布相同内容的素材（转发、任务失败后重试）时直接复用之前的文件 id，不再申请上传许可和上传文件。
+    记录保存在进程内；传入 redis_client 时同时写入 Redis，多个 worker 之间共享，Redis 不可用时只使用进程内的记录。
+    """
+
+    def __init__(self, ttl: float = UPLOAD_DEDUP_TTL, redis_client=None, key_prefix: str = "xhs:upload:",
+                 max_size: int = 10000):
+        """
+        :param ttl: 记录的有效期（秒），不应超过平台保留上传文件的时间
+        :param redis_client: 可选，redis.Redis
+        :param key_prefix: Redis key 前缀
+        :param max_size: 进程内最多保存多少条记录，超出后淘汰最早写入的
+        """
+        self.ttl = ttl
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, account: str, file_type: str, content_hash: str) -> str:
+        return f"{self.key_prefix}{account}:{file_type}:{content_hash}"
+
+    def get(self, account: str, file_type: str, content_hash: str):
+        """返回上传时记录的信息，例如 {"file_id": ""}，没有记录或已过期时返回 None"""
+        key = self._key(account, file_type, content_hash)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.time():
+                    return entry[1]
+                del self._entries[key]
+        if self.redis_client is None:
+            return None
+        try:
+            value = self.redis_client.get(key)
+            ttl = self.redis_client.ttl(key)
+        except Exception as e:
+            print(f"读取上传去重记录失败：{e}")
+            return None
+        if value is None:
+            return None
+        value = json.loads(value)
+        with self._lock:
+            self._set_local(key, value, time.time() + (ttl if ttl and ttl > 0 else self.ttl))
+        return value
+
+    def put(self, account: str, file_type: str, content_hash: str, value: dict):
+        key = self._key(account, file_type, content_hash)
+        with self._lock:
+            self._set_local(key, value, time.time() + self.ttl)
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.set(key, json.dumps(value), ex=int(self.ttl))
+        except Exception as e:
+            print(f"写入上传去重记录失败：{e}")
+
+    def forget(self, account: str, file_type: str, content_hash: str):
+        """复用的文件 id 被平台拒绝时删除记录，下次重新上传"""
+        key = self._key(account, file_type, content_hash)
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.delete(key)
+        except Exception as e:
+            print(f"删除上传去重记录失败：{e}")
+
+    def _set_local(self, key: str, value: dict, expire_at: float):
+        self._entries[key] = (expire_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
@@ -0,0 +1,144 @@
+import hashlib
+import re
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+from xml.etree import ElementTree
+
+
+def start_stub_server(handler_class: type) -> ThreadingHTTPServer:
+    """在本机随机端口上启动测试用的 HTTP 服务，返回的 server 用完后调用 shutdown()"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def reply(self, body: bytes, status: int = 200, headers: dict = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class CosStub:
+    """模拟 ros-upload 的对象存储服务，支持单次 PUT 和分片上传，并在 /source/<name> 下提供支持 Range 的源文件
+
+    fail_parts 为 {分片序号: 剩余失败次数}，用于模拟分片上传失败。
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.sources = {}
+        self.fail_parts = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        self.server = start_stub_server(self._handler_class())
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+
+    def source_url(self, name: str) -> str:
+        return f"{self.url}source/{name}"
+
+    def part_puts(self, file_id: str) -> list:
+        """按请求顺序返回该文件上传过的分片序号（包括失败的请求）"""
+        return [
+            int(query["partNumber"]) for method, path, query in self.requests
+            if method == "PUT" and path == file_id and "partNumber" in query
+        ]
+
+    def initiated(self, file_id: str) -> int:
+        return sum(
+            1 for method, path, query in self.requests if method == "POST" and path == file_id and "uploads" in query
+        )
+
+    def shutdown(self):
+        self.server.shutdown()
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(QuietHandler):
+            def _route(self):
+                split = urlsplit(self.path)
+                path = split.path.lstrip("/")
+                query = dict(parse_qsl(split.query, keep_blank_values=True))
+                body = self.read_body()
+                with stub._lock:
+                    stub.requests.append((self.command, path, query))
+                if path.startswith("source/"):
+                    return self._source(path[len("source/"):])
+                if self.command == "POST" and "uploads" in query:
+                    upload_id = uuid.uuid4().hex
+                    with stub._lock:
+                        stub.uploads[upload_id] = {}
+                    xml = f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+                    return self.reply(xml.encode("utf-8"))
+                if self.command == "PUT" and "partNumber" in query:
+                    return self._put_part(int(query["partNumber"]), query["uploadId"], body)
+                if self.command == "POST" and "uploadId" in query:
+                    return self._complete(path, query["uploadId"], body)
+                if self.command == "PUT":
+                    with stub._lock:
+                        stub.objects[path] = body
+                    return self.reply(b"", headers={"X-Ros-Video-Id": f"video-{path}"})
+                self.reply(b"not found", status=404)
+
+            do_GET = do_PUT = do_POST = _route
+
+            def _source(self, name):
+                data = stub.sources.get(name)
+                if data is None:
+                    return self.reply(b"not found", status=404)
+                match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+                if not match:
+                    return self.reply(data)
+                start, end = int(match.group(1)), min(int(match.group(2)), len(data) - 1)
+                self.reply(data[start:end + 1], status=206,
+                           headers={"Content-Range": f"bytes {start}-{end}/{len(data)}"})
+
+            def _put_part(self, number, upload_id, body):
+                with stub._lock:
+                    if stub.fail_parts.get(number):
+                        stub.fail_parts[number] -= 1
+                        failed = True
+                    else:
+                        failed = False
+                    parts = stub.uploads.get(upload_id)
+                    if parts is not None and not failed:
+                        parts[number] = body
+                if failed:
+                    return self.reply(b"injected failure", status=500)
+                if parts is None:
+                    return self.reply(b"NoSuchUpload", status=404)
+                self.reply(b"", headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+
+            def _complete(self, path, upload_id, body):
+                root = ElementTree.fromstring(body)
+                with stub._lock:
+                    parts = stub.uploads.get(upload_id)
+                    if parts is None:
+                        return self.reply(b"NoSuchUpload", status=404)
+                    chunks = []
+                    for part in root.iter("Part"):
+                        data = parts.get(int(part.findtext("PartNumber")))
+                        if data is None or part.findtext("ETag") != f'"{hashlib.md5(data).hexdigest()}"':
+                            return self.reply(b"InvalidPart", status=400)
+                        chunks.append(data)
+                    stub.objects[path] = b"".join(chunks)
+                    del stub.uploads[upload_id]
+                self.reply(b"", headers={"X-Ros-Video-Id": f"video-{path}"})
+
+        return Handler
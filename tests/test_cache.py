@@ -0,0 +1,200 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.xhs import cache as cache_module
+from src.xhs.cache import SharedCache, TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class MemoryRedis:
+    """只实现 SharedCache 用到的 get / set / delete，不处理 key 的过期，并记录 get 的次数"""
+
+    def __init__(self):
+        self.values = {}
+        self.gets = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            self.gets += 1
+            return self.values.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        with self._lock:
+            if nx and key in self.values:
+                return None
+            self.values[key] = value.encode("utf-8") if isinstance(value, str) else value
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self.values.pop(key, None)
+
+
+class BrokenRedis:
+    def get(self, *args, **kwargs):
+        raise ConnectionError("redis down")
+
+    set = delete = get
+
+
+def put_entry(redis, key, value, expire_at):
+    """模拟其他节点写入的缓存"""
+    redis.values[f"xhs:cache:{key}"] = json.dumps({"value": value, "expire_at": expire_at}).encode("utf-8")
+
+
+class Loader:
+    def __init__(self, value="loaded", delay: float = 0):
+        self.value = value
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.value
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "time", clock.time)
+    return clock
+
+
+def test_ttl_cache_expires_values(clock):
+    cache = TTLCache(60, negative_ttl=10)
+    cache.set("topic:a", {"id": "a"})
+    cache.set("topic:missing", None)
+
+    clock.now += 11
+    assert cache.lookup("topic:a") == (True, {"id": "a"})
+    # 负缓存的有效期更短
+    assert cache.lookup("topic:missing") == (False, None)
+    clock.now += 50
+    assert "topic:a" not in cache
+
+
+def test_ttl_cache_evicts_least_recently_used(clock):
+    cache = TTLCache(60, max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.lookup("a")
+    cache.set("c", 3)
+
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+
+
+def test_ttl_cache_loads_each_key_once():
+    cache = TTLCache(60)
+    loader = Loader(delay=0.05)
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda _: cache.get_or_load("topic:a", loader), range(16)))
+
+    assert results == ["loaded"] * 16
+    assert loader.calls == 1
+    assert cache.stats()["misses"] == 1
+    assert cache._loading == {}
+
+
+def test_ttl_cache_does_not_cache_errors():
+    cache = TTLCache(60)
+
+    def fail():
+        raise Exception("搜索失败")
+
+    with pytest.raises(Exception, match="搜索失败"):
+        cache.get_or_load("topic:a", fail)
+    assert cache.get_or_load("topic:a", Loader()) == "loaded"
+
+
+def test_shared_cache_serves_stale_value_while_other_node_refreshes():
+    redis = MemoryRedis()
+    put_entry(redis, "topic:a", "old", time.time() - 1)
+    redis.values["xhs:cache:lock:topic:a"] = b"other-node"
+    cache = SharedCache(redis)
+    loader = Loader("new")
+
+    assert cache.get_or_load("topic:a", loader) == "old"
+    assert loader.calls == 0
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_shared_cache_refreshes_stale_value_when_lock_is_free():
+    redis = MemoryRedis()
+    put_entry(redis, "topic:a", "old", time.time() - 1)
+    cache = SharedCache(redis)
+    loader = Loader("new")
+
+    assert cache.get_or_load("topic:a", loader) == "new"
+    assert loader.calls == 1
+    assert json.loads(redis.values["xhs:cache:topic:a"])["value"] == "new"
+    # 刷新完成后释放锁
+    assert "xhs:cache:lock:topic:a" not in redis.values
+
+
+def test_shared_cache_waits_for_other_node_without_stale_value():
+    redis = MemoryRedis()
+    redis.values["xhs:cache:lock:topic:a"] = b"other-node"
+    cache = SharedCache(redis, wait_timeout=5)
+    loader = Loader("mine")
+    timer = threading.Timer(0.2, put_entry, (redis, "topic:a", "theirs", time.time() + 60))
+    timer.start()
+
+    assert cache.get_or_load("topic:a", loader) == "theirs"
+    assert loader.calls == 0
+    timer.join()
+
+
+def test_shared_cache_loads_itself_after_wait_timeout():
+    redis = MemoryRedis()
+    redis.values["xhs:cache:lock:topic:a"] = b"other-node"
+    cache = SharedCache(redis, wait_timeout=0.3)
+    loader = Loader("mine")
+
+    assert cache.get_or_load("topic:a", loader) == "mine"
+    assert loader.calls == 1
+    # 锁属于其他节点，不能被删除
+    assert redis.values["xhs:cache:lock:topic:a"] == b"other-node"
+
+
+def test_shared_cache_lookup_fills_local_cache():
+    redis = MemoryRedis()
+    put_entry(redis, "topic:a", "shared", time.time() + 60)
+    cache = SharedCache(redis)
+
+    assert cache.lookup("topic:a") == (True, "shared")
+    gets = redis.gets
+    assert "topic:a" in cache
+    assert cache.get_or_load("topic:a", Loader()) == "shared"
+    assert redis.gets == gets
+
+
+def test_shared_cache_ignores_stale_values_in_lookup():
+    redis = MemoryRedis()
+    put_entry(redis, "topic:a", "old", time.time() - 1)
+
+    assert SharedCache(redis).lookup("topic:a") == (False, None)
+
+
+def test_shared_cache_falls_back_to_loader_without_redis():
+    cache = SharedCache(BrokenRedis())
+    loader = Loader()
+
+    assert cache.get_or_load("topic:a", loader) == "loaded"
+    assert cache.get_or_load("topic:a", loader) == "loaded"
+    # 进程内缓存仍然有效
+    assert loader.calls == 1
@@ -0,0 +1,27 @@
+from src.utils.checkpoint import task_checkpoint_key
+
+
+def make_task(**input_data):
+    return {
+        "workflowInstanceId": "wf-1",
+        "referenceTaskName": "xiaohongshu_1",
+        "taskId": "task-1",
+        "inputData": input_data,
+    }
+
+
+def test_key_is_stable_across_retries():
+    first = make_task(title="a", images=["x.jpg"])
+    retry = dict(make_task(images=["x.jpg"], title="a"), taskId="task-2")
+    assert task_checkpoint_key(first) == task_checkpoint_key(retry)
+    assert task_checkpoint_key(first).startswith("checkpoint:wf-1:xiaohongshu_1:")
+
+
+def test_changed_input_does_not_reuse_checkpoint():
+    assert task_checkpoint_key(make_task(title="a")) != task_checkpoint_key(make_task(title="b"))
+
+
+def test_falls_back_to_task_id():
+    task = {"taskId": "task-1", "inputData": {"title": "a"}}
+    assert task_checkpoint_key(task).startswith("checkpoint:task-1:")
+    assert task_checkpoint_key({}) is None
@@ -0,0 +1,109 @@
+import json
+import threading
+
+import pytest
+
+from src.utils.distributed_limit import Budget, DistributedLimiter, RateLimitExceeded
+from src.xhs.core import XhsClient
+from src.xhs.metrics import InMemoryMetrics
+from src.xhs.ratelimit import RateLimiter
+from src.xhs.retry import RetryEngine
+
+from .stub_server import QuietHandler, start_stub_server
+
+
+class LeaseRedis:
+    """只实现 DistributedLimiter 用到的 register_script，在内存中执行与 LEASE_SCRIPT 相同的逻辑，并记录调用次数"""
+
+    def __init__(self):
+        self.counters = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def register_script(self, script):
+        def run(keys, args):
+            limit, lease = int(args[0]), int(args[1])
+            with self._lock:
+                self.calls += 1
+                current = self.counters.get(keys[0], 0)
+                grant = min(lease, limit - current)
+                if grant <= 0:
+                    return 0
+                self.counters[keys[0]] = current + grant
+                return grant
+
+        return run
+
+
+class SignErrorHandler(QuietHandler):
+    """发布笔记的接口前 fail_times 次返回签名错误，之后成功"""
+    fail_times = 0
+    publishes = 0
+
+    def do_POST(self):
+        self.read_body()
+        if self.path == "/web_api/sns/v2/note":
+            SignErrorHandler.publishes += 1
+            if SignErrorHandler.publishes <= SignErrorHandler.fail_times:
+                return self.reply(json.dumps({"code": 300015}).encode("utf-8"))
+        self.reply(json.dumps({"success": True, "data": {"id": "note"}}).encode("utf-8"))
+
+
+@pytest.fixture
+def server():
+    server = start_stub_server(SignErrorHandler)
+    SignErrorHandler.publishes = 0
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def make_client(host: str, limiter: DistributedLimiter) -> XhsClient:
+    client = XhsClient(
+        cookie="a1=limit;webId=limit",
+        sign=lambda uri, data=None, a1="", web_session="": {"x-s": "s", "x-t": "1"},
+        metrics=InMemoryMetrics(),
+        rate_limiter=RateLimiter(account_rate=(1e6, 1e6, 1e6), egress_rate=(1e6, 1e6, 1e6)),
+        distributed_limiter=limiter,
+        retry_engine=RetryEngine(base_delay=0, max_delay=0),
+    )
+    client._host = host
+    return client
+
+
+def test_signed_budget_is_leased_in_batches():
+    redis_client = LeaseRedis()
+    limiter = DistributedLimiter(redis_client)
+    lease = limiter.budgets["xhs:signed"].lease
+    assert lease > 1
+
+    for _ in range(lease * 2):
+        limiter.acquire("xhs:signed", "account")
+
+    assert redis_client.calls == 2
+
+
+def test_publish_budget_taken_once_per_note(server):
+    SignErrorHandler.fail_times = 2
+    redis_client = LeaseRedis()
+    client = make_client(server, DistributedLimiter(redis_client))
+
+    client.create_note("title", "desc", "normal", hash_tags=[])
+
+    assert SignErrorHandler.publishes == 3
+    publish_keys = [key for key in redis_client.counters if key.startswith("ratelimit:xhs:publish:")]
+    assert [redis_client.counters[key] for key in publish_keys] == [1]
+
+
+def test_read_budget_per_endpoint(server):
+    limiter = DistributedLimiter(LeaseRedis(), budgets={
+        "xhs:signed": Budget(1000, 10, lease=10),
+        "xhs:read:/api/sns/web/v1/feed": Budget(3, 3600),
+    })
+    client = make_client(server, limiter)
+
+    for _ in range(3):
+        client.post("/api/sns/web/v1/feed", {})
+    with pytest.raises(RateLimitExceeded):
+        client.post("/api/sns/web/v1/feed", {})
+    # 其他接口不受这个接口额度的影响
+    client.post("/api/sns/web/v1/search/notes", {})
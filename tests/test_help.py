@@ -0,0 +1,33 @@
+import json
+import os
+
+import pytest
+
+from src.xhs.help import b64Encode, encodeUtf8, mrc, sign
+
+# 由改写前的逐字符实现生成的签名结果，新的查表实现必须与之完全一致
+with open(os.path.join(os.path.dirname(__file__), "data", "help_golden.json"), encoding="utf-8") as f:
+    GOLDEN = json.load(f)
+
+
+@pytest.mark.parametrize("vector", GOLDEN["sign"])
+def test_sign(vector):
+    signs = sign(vector["uri"], vector["data"], ctime=vector["ctime"], a1=vector["a1"], b1=vector["b1"])
+    assert signs == vector["expected"]
+
+
+@pytest.mark.parametrize("vector", GOLDEN["mrc"])
+def test_mrc(vector):
+    assert mrc(vector["input"]) == vector["expected"]
+
+
+@pytest.mark.parametrize("vector", GOLDEN["b64Encode"])
+def test_b64_encode(vector):
+    data = bytes.fromhex(vector["input"])
+    assert b64Encode(data) == vector["expected"]
+    assert b64Encode(list(data)) == vector["expected"]
+
+
+@pytest.mark.parametrize("vector", GOLDEN["encodeUtf8"])
+def test_encode_utf8(vector):
+    assert encodeUtf8(vector["input"]) == vector["expected"]
@@ -0,0 +1,93 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import src.utils
+from src.utils import MediaCache, download_image, open_upload_stream
+
+from .stub_server import CosStub
+
+
+@pytest.fixture
+def cos():
+    cos = CosStub()
+    yield cos
+    cos.shutdown()
+
+
+@pytest.fixture
+def media_cache(tmp_path, monkeypatch):
+    media_cache = MediaCache(str(tmp_path / "media-cache"), 64 * 1024 * 1024)
+    monkeypatch.setattr(src.utils, "get_media_cache", lambda: media_cache)
+    return media_cache
+
+
+def test_upload_stream_fills_cache_while_streaming(cos, media_cache):
+    data = os.urandom(300 * 1024)
+    cos.sources["video.mp4"] = data
+    url = cos.source_url("video.mp4")
+
+    with open_upload_stream(url) as body:
+        first = body.read(1024)
+        # 还没有读完，不能提前出现在缓存中
+        assert media_cache.lookup(url) is None
+        rest = b"".join(body)
+    assert first + rest == data
+
+    path, content_hash = media_cache.lookup(url)
+    assert content_hash == hashlib.sha256(data).hexdigest()
+    with open(path, "rb") as f:
+        assert f.read() == data
+    # 再次打开直接读取缓存，不再请求源地址
+    requests_before = len(cos.requests)
+    with open_upload_stream(url) as body:
+        assert b"".join(body) == data
+    assert len(cos.requests) == requests_before
+
+
+def test_partially_read_stream_is_not_cached(cos, media_cache):
+    cos.sources["video.mp4"] = os.urandom(300 * 1024)
+    url = cos.source_url("video.mp4")
+
+    with open_upload_stream(url) as body:
+        body.read(1024)
+
+    assert media_cache.lookup(url) is None
+    assert os.listdir(media_cache.tmp_folder) == []
+
+
+def test_url_locks_are_released(cos, media_cache):
+    for i in range(20):
+        cos.sources[f"{i}.jpg"] = os.urandom(1024)
+    urls = [cos.source_url(f"{i % 20}.jpg") for i in range(100)]
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(media_cache.read, urls))
+
+    assert media_cache._url_locks == {}
+    assert media_cache.stats()["misses"] == 20
+
+
+def test_oversized_object_is_read_without_caching(cos, media_cache):
+    small = os.urandom(1024)
+    large = os.urandom(media_cache.max_size // 4 + 1)
+    cos.sources["small.jpg"] = small
+    cos.sources["large.mp4"] = large
+
+    assert media_cache.read(cos.source_url("small.jpg")) == small
+    assert media_cache.read(cos.source_url("large.mp4")) == large
+
+    assert media_cache.lookup(cos.source_url("small.jpg")) is not None
+    assert media_cache.lookup(cos.source_url("large.mp4")) is None
+    assert os.listdir(media_cache.tmp_folder) == []
+
+
+def test_download_image_raises_on_http_error(cos, media_cache, monkeypatch):
+    with pytest.raises(requests.HTTPError):
+        download_image(cos.source_url("missing.jpg"))
+    monkeypatch.setattr(src.utils, "get_media_cache", lambda: None)
+    with pytest.raises(requests.HTTPError):
+        download_image(cos.source_url("missing.jpg"))
@@ -0,0 +1,205 @@
+import hashlib
+import os
+
+import pytest
+
+import src.utils
+from src.utils import MediaCache
+from src.xhs import multipart
+from src.xhs.core import XhsClient
+from src.xhs.metrics import InMemoryMetrics
+from src.xhs.multipart import MultipartUploader
+from src.xhs.permit import UploadPermit
+from src.xhs.upload_index import UploadDedupIndex
+
+from .stub_server import CosStub
+
+PART_SIZE = 64 * 1024
+
+
+class MemoryCheckpoint:
+    """与 TaskCheckpoint 接口相同，保存在内存中"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def get(self, stage: str):
+        return self.stages.get(stage)
+
+    def set(self, stage: str, value):
+        self.stages[stage] = value
+
+
+@pytest.fixture
+def cos():
+    cos = CosStub()
+    yield cos
+    cos.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    # 进度文件写到临时目录，不使用素材缓存，分片重试不等待
+    monkeypatch.setattr(multipart, "get_manifest_folder", lambda: str(tmp_path))
+    monkeypatch.setattr(src.utils, "MEDIA_CACHE_SIZE_MB", 0)
+    monkeypatch.setattr(multipart.time, "sleep", lambda seconds: None)
+
+
+def make_client(cos: CosStub) -> XhsClient:
+    client = XhsClient(cookie="a1=upload;webId=upload", metrics=InMemoryMetrics())
+    client._upload_host = cos.url
+    return client
+
+
+def make_source(cos: CosStub, name: str, size: int) -> tuple:
+    data = os.urandom(size)
+    cos.sources[name] = data
+    return cos.source_url(name), data
+
+
+def test_failed_part_is_retried(cos):
+    source_url, data = make_source(cos, "video.mp4", PART_SIZE * 4 + 123)
+    cos.fail_parts[2] = 2
+    uploader = MultipartUploader(make_client(cos), part_size=PART_SIZE, upload_host=cos.url)
+
+    response = uploader.upload("file-1", "token", source_url)
+
+    assert response.headers["X-Ros-Video-Id"] == "video-file-1"
+    assert cos.objects["file-1"] == data
+    assert sorted(cos.part_puts("file-1")) == [1, 2, 2, 2, 3, 4, 5]
+
+
+def test_resume_skips_completed_parts(cos, tmp_path):
+    source_url, data = make_source(cos, "video.mp4", PART_SIZE * 4 + 123)
+    cos.fail_parts[3] = 10
+    uploader = MultipartUploader(make_client(cos), part_size=PART_SIZE, part_retries=1, upload_host=cos.url)
+
+    with pytest.raises(Exception, match="分片 3 上传失败"):
+        uploader.upload("file-1", "token", source_url)
+    assert "file-1" not in cos.objects
+    assert os.listdir(tmp_path) == ["file-1.json"]
+
+    cos.fail_parts.clear()
+    first_run = len(cos.part_puts("file-1"))
+    uploader.upload("file-1", "token", source_url)
+
+    assert cos.objects["file-1"] == data
+    assert cos.part_puts("file-1")[first_run:] == [3]
+    assert cos.initiated("file-1") == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_small_file_is_put_in_one_request(cos):
+    source_url, data = make_source(cos, "small.mp4", PART_SIZE - 1)
+    uploader = MultipartUploader(make_client(cos), part_size=PART_SIZE, upload_host=cos.url)
+
+    uploader.upload("file-1", "token", source_url)
+
+    assert cos.objects["file-1"] == data
+    assert cos.part_puts("file-1") == []
+
+
+def upload_video_with_retry(cos, tmp_path, monkeypatch, lose_manifest: bool):
+    """第一次上传在第 2 个分片失败，模拟任务重试时用新的客户端和同一个检查点再次上传"""
+    # 视频按默认的 8MB 分片上传
+    source_url, data = make_source(cos, "video.mp4", multipart.MULTIPART_PART_SIZE * 2 + 123)
+    permits = []
+
+    def get_upload_files_permits(file_type, count=1):
+        permits.append(UploadPermit(f"video-file-{len(permits)}", "token", 4102444800))
+        return permits[-1:]
+
+    checkpoint = MemoryCheckpoint()
+    cos.fail_parts[2] = multipart.MULTIPART_PART_RETRIES + 1
+    client = make_client(cos)
+    monkeypatch.setattr(client, "get_upload_files_permits", get_upload_files_permits)
+    with pytest.raises(Exception, match="分片 2 上传失败"):
+        client._upload_video(source_url, multipart=True, checkpoint=checkpoint)
+    assert checkpoint.get("video_permit")["upload_id"]
+    if lose_manifest:
+        for name in os.listdir(tmp_path):
+            os.remove(os.path.join(tmp_path, name))
+
+    client = make_client(cos)
+    monkeypatch.setattr(client, "get_upload_files_permits", get_upload_files_permits)
+    first_run = len(cos.part_puts("video-file-0"))
+    video = client._upload_video(source_url, multipart=True, checkpoint=checkpoint)
+
+    assert len(permits) == 1
+    assert video["file_id"] == "video-file-0"
+    assert video["video_id"] == "video-video-file-0"
+    assert cos.objects["video-file-0"] == data
+    assert cos.initiated("video-file-0") == 1
+    return cos.part_puts("video-file-0")[first_run:]
+
+
+def test_video_upload_resumes_after_task_retry(cos, tmp_path, monkeypatch):
+    assert upload_video_with_retry(cos, tmp_path, monkeypatch, lose_manifest=False) == [2]
+
+
+def test_video_upload_reuses_upload_id_without_manifest(cos, tmp_path, monkeypatch):
+    retried_parts = upload_video_with_retry(cos, tmp_path, monkeypatch, lose_manifest=True)
+    assert sorted(retried_parts) == [1, 2, 3]
+
+
+def test_video_dedup_after_multipart_upload(cos, tmp_path, monkeypatch):
+    media_cache = MediaCache(str(tmp_path / "media-cache"), 1024 * 1024 * 1024)
+    monkeypatch.setattr(src.utils, "MEDIA_CACHE_SIZE_MB", 1024)
+    monkeypatch.setattr(src.utils, "_media_cache", media_cache)
+    source_url, data = make_source(cos, "video.mp4", multipart.MULTIPART_PART_SIZE + 123)
+    permits = []
+
+    def get_upload_files_permits(file_type, count=1):
+        permits.append(UploadPermit(f"video-file-{len(permits)}", "token", 4102444800))
+        return permits[-1:]
+
+    client = make_client(cos)
+    client.upload_index = UploadDedupIndex()
+    monkeypatch.setattr(client, "get_upload_files_permits", get_upload_files_permits)
+
+    first = client._upload_video(source_url, multipart=True)
+    assert first["content_hash"] == hashlib.sha256(data).hexdigest()
+    assert media_cache.lookup(source_url)[1] == first["content_hash"]
+
+    second = client._upload_video(source_url, multipart=True)
+    assert second["reused"] and second["file_id"] == first["file_id"]
+    assert len(permits) == 1
+
+
+def test_video_is_put_in_one_request_by_default(cos, monkeypatch):
+    source_url, data = make_source(cos, "video.mp4", multipart.MULTIPART_PART_SIZE + 123)
+    client = make_client(cos)
+    monkeypatch.setattr(client, "get_upload_files_permits",
+                        lambda file_type, count=1: [UploadPermit("video-file-0", "token", 4102444800)])
+
+    video = client._upload_video(source_url)
+
+    assert video["video_id"] == "video-video-file-0"
+    assert cos.objects["video-file-0"] == data
+    assert cos.initiated("video-file-0") == 0
+    assert cos.part_puts("video-file-0") == []
+
+
+def test_rejected_reused_video_resets_dependent_stages(cos, monkeypatch):
+    """复用的视频被拒绝时，检查点中的视频、首帧封面和上传许可一起作废，重试时重新上传"""
+    client = make_client(cos)
+    checkpoint = MemoryCheckpoint()
+    checkpoint.set("cover", {"file_id": "cover-1", "is_upload": False, "ts": 0})
+    checkpoint.set("video_permit", {"file_id": "video-file-0", "token": "token", "expire_at": 4102444800})
+    checkpoint.set("video", {"file_id": "video-file-0", "video_id": "video-0", "content_hash": "h", "reused": True})
+    forgotten = []
+
+    def create_note(*args, **kwargs):
+        raise Exception("视频不存在")
+
+    monkeypatch.setattr(client, "search_tags", lambda topics: [])
+    monkeypatch.setattr(client, "create_note", create_note)
+    monkeypatch.setattr(client, "forget_uploaded", lambda file_type, content_hash: forgotten.append(content_hash))
+
+    with pytest.raises(Exception, match="视频不存在"):
+        client.create_video_note("title", "video.mp4", "desc", checkpoint=checkpoint)
+
+    assert forgotten == ["h"]
+    assert checkpoint.get("video") is None
+    assert checkpoint.get("cover") is None
+    assert checkpoint.get("video_permit") is None
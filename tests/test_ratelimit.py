@@ -0,0 +1,68 @@
+import json
+import time
+
+import pytest
+
+from src.xhs.cache import TTLCache
+from src.xhs.core import XhsClient
+from src.xhs.metrics import InMemoryMetrics
+from src.xhs.ratelimit import RateLimiter
+
+from .stub_server import QuietHandler, start_stub_server
+
+TOPICS = [f"topic-{i}" for i in range(8)]
+# 每个请求在服务端停留的时间，并发执行时总耗时接近一个请求，串行时接近 len(TOPICS) 个
+LATENCY = 0.3
+
+
+class TopicHandler(QuietHandler):
+    def do_POST(self):
+        keyword = json.loads(self.read_body())["keyword"]
+        time.sleep(LATENCY)
+        body = {"success": True, "data": {"topic_info_dtos": [{"id": keyword, "link": "", "name": keyword}]}}
+        self.reply(json.dumps(body).encode("utf-8"))
+
+    def do_GET(self):
+        self.reply(json.dumps({"success": True, "data": {"notes": []}}).encode("utf-8"))
+
+
+@pytest.fixture
+def server():
+    server = start_stub_server(TopicHandler)
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def make_client(host: str, rate_limiter: RateLimiter) -> XhsClient:
+    client = XhsClient(
+        cookie="a1=rate;webId=rate",
+        sign=lambda uri, data=None, a1="", web_session="": {"x-s": "s", "x-t": "1"},
+        cache=TTLCache(60),
+        metrics=InMemoryMetrics(),
+        rate_limiter=rate_limiter,
+    )
+    client._host = host
+    return client
+
+
+def test_concurrent_search_tags_are_not_serialised(server):
+    # 默认的限速器：每个账号约 1 次/秒
+    client = make_client(server, RateLimiter(metrics=InMemoryMetrics()))
+
+    started = time.time()
+    hashtags = client.search_tags(TOPICS, max_workers=len(TOPICS))
+
+    assert [hashtag["name"] for hashtag in hashtags] == TOPICS
+    assert time.time() - started < LATENCY * 3
+
+
+def test_only_crawl_endpoints_use_token_buckets(server):
+    rate_limiter = RateLimiter(metrics=InMemoryMetrics())
+    client = make_client(server, rate_limiter)
+
+    client.search_tags(TOPICS[:2])
+    assert rate_limiter.stats() == {}
+
+    client.get("/api/sns/web/v1/user_posted", {"num": 30})
+    account = f"account:{client.cookie_dict['a1']}"
+    assert rate_limiter.stats()[account]["successes"] == 1
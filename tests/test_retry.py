@@ -0,0 +1,149 @@
+import pytest
+import requests
+
+from src.xhs import retry
+from src.xhs.exception import CircuitOpenError, DataFetchError, IPBlockError, SignError
+from src.xhs.retry import CircuitBreaker, RetryEngine
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(retry.time, "time", clock.time)
+    monkeypatch.setattr(retry.time, "sleep", lambda seconds: None)
+    return clock
+
+
+class Failing:
+    """按顺序抛出 errors 中的异常，用完后返回 ok"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def test_breaker_opens_after_threshold_blocks(clock):
+    breaker = CircuitBreaker(threshold=3, window=60, open_seconds=120)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.on_ip_block()
+    assert not breaker.is_open
+
+    breaker.before_call()
+    breaker.on_ip_block()
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_blocks_outside_window_do_not_open_breaker(clock):
+    breaker = CircuitBreaker(threshold=3, window=60, open_seconds=120)
+    for _ in range(5):
+        breaker.on_ip_block()
+        clock.now += 31
+    assert not breaker.is_open
+
+
+def test_half_open_allows_single_probe(clock):
+    breaker = CircuitBreaker(threshold=1, window=60, open_seconds=120)
+    breaker.on_ip_block()
+    clock.now += 121
+
+    breaker.before_call()
+    # 试探请求还没有结束，其他请求继续被拒绝
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.on_success()
+    assert not breaker.is_open
+    breaker.before_call()
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_breaker(clock):
+    breaker = CircuitBreaker(threshold=3, window=60, open_seconds=120)
+    for _ in range(3):
+        breaker.on_ip_block()
+    clock.now += 121
+
+    breaker.before_call()
+    # 试探请求再次被封 IP，即使没有达到阈值也重新打开，并重新计时
+    breaker.on_ip_block()
+    assert breaker.is_open
+    clock.now += 60
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_probe_failing_for_other_reasons_keeps_breaker_half_open(clock):
+    breaker = CircuitBreaker(threshold=1, window=60, open_seconds=120)
+    breaker.on_ip_block()
+    clock.now += 121
+
+    breaker.before_call()
+    breaker.release()
+    # 状态不变，下一个请求仍然可以作为试探
+    breaker.before_call()
+    assert breaker.is_open
+
+
+def test_non_idempotent_post_is_not_retried_on_transport_error(clock):
+    engine = RetryEngine(attempts=3)
+    func = Failing(requests.ConnectionError("connection reset"))
+
+    with pytest.raises(requests.ConnectionError):
+        engine.call("account", func, idempotent=False)
+    assert func.calls == 1
+
+
+def test_idempotent_get_is_retried_on_transport_error(clock):
+    engine = RetryEngine(attempts=3)
+    func = Failing(requests.ConnectionError("connection reset"), requests.ReadTimeout("read timeout"))
+
+    assert engine.call("account", func, idempotent=True) == "ok"
+    assert func.calls == 3
+
+
+@pytest.mark.parametrize("error", [SignError("sign"), requests.ConnectTimeout("connect timeout")])
+def test_non_idempotent_post_is_retried_when_request_was_not_processed(clock, error):
+    engine = RetryEngine(attempts=3)
+    func = Failing(error)
+
+    assert engine.call("account", func, idempotent=False) == "ok"
+    assert func.calls == 2
+
+
+def test_business_errors_are_not_retried(clock):
+    engine = RetryEngine(attempts=3)
+    func = Failing(DataFetchError("笔记不存在"))
+
+    with pytest.raises(DataFetchError):
+        engine.call("account", func, idempotent=True)
+    assert func.calls == 1
+
+
+def test_ip_blocks_open_breaker_and_stop_retries(clock):
+    engine = RetryEngine(attempts=5, threshold=2, window=60, open_seconds=120)
+    func = Failing(*[IPBlockError("ip block") for _ in range(5)])
+
+    with pytest.raises(CircuitOpenError):
+        engine.call("account", func, idempotent=True)
+    assert func.calls == 2
+    # 同一账号的其他请求在熔断期间直接失败，其他账号不受影响
+    with pytest.raises(CircuitOpenError):
+        engine.call("account", Failing(), idempotent=True)
+    assert engine.call("other", Failing(), idempotent=True) == "ok"
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.xhs.registry import XhsClientRegistry
+from src.xhs.sign import DEFAULT_SIGN_KEY, BrowserSigner, SignAssetCache
+
+
+class FakePage:
+    def is_closed(self):
+        return False
+
+    async def evaluate(self, script, requests):
+        return [{"X-s": uri, "X-t": 1} for uri, _ in requests]
+
+
+class FakeContext:
+    def __init__(self, closed: list, key: tuple):
+        self.closed = closed
+        self.key = key
+
+    async def close(self):
+        self.closed.append(self.key)
+
+
+class FakeSigner(BrowserSigner):
+    """不启动浏览器，打开页面时只记录账号，用来检查页面池的复用和淘汰"""
+
+    def __init__(self, **kwargs):
+        super().__init__(block_resources=False, **kwargs)
+        self.opened = []
+        self.closed = []
+
+    async def _launch(self):
+        self._cond = asyncio.Condition()
+
+    async def _shutdown(self):
+        pass
+
+    async def _open_page(self, sign_page):
+        self.opened.append(sign_page.key)
+        sign_page.context, sign_page.page = FakeContext(self.closed, sign_page.key), FakePage()
+
+
+@pytest.fixture
+def make_signer():
+    signers = []
+
+    def make(**kwargs):
+        signer = FakeSigner(**kwargs)
+        signers.append(signer)
+        return signer
+
+    yield make
+    for signer in signers:
+        signer.close()
+
+
+def test_start_warms_default_page(make_signer):
+    signer = make_signer()
+    signer.start()
+    # 预热在事件循环中异步进行，start() 不等待它完成
+    deadline = time.monotonic() + 5
+    while not signer.opened and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert signer.opened == [DEFAULT_SIGN_KEY]
+    assert signer.stats()["contexts"] == 1
+
+
+def test_warmed_account_page_is_reused(make_signer):
+    signer = make_signer(warm_on_start=False)
+    signer.warm([("a1-1", ""), ("a1-2", "session"), ("a1-1", "")], wait=True)
+
+    assert sorted(signer.opened) == [("a1-1", ""), ("a1-2", "session")]
+    assert signer.sign("/api/a", a1="a1-1") == {"x-s": "/api/a", "x-t": "1"}
+    assert signer.sign("/api/b", a1="a1-2", web_session="session")["x-s"] == "/api/b"
+    assert len(signer.opened) == 2
+    assert signer.closed == []
+
+
+def test_least_recently_used_page_is_evicted(make_signer):
+    signer = make_signer(pool_size=2, warm_on_start=False)
+    signer.warm([("a1-1", ""), ("a1-2", "")], wait=True)
+    # a1-1 刚刚用过，页面池满时淘汰 a1-2
+    signer.sign("/api/a", a1="a1-1")
+    signer.sign("/api/a", a1="a1-3")
+
+    assert signer.closed == [("a1-2", "")]
+    assert signer.stats()["contexts"] == 2
+    signer.sign("/api/a", a1="a1-1")
+    assert signer.opened.count(("a1-1", "")) == 1
+
+
+def test_registry_warms_new_accounts():
+    warmed = []
+
+    class Signer:
+        def __call__(self, uri, data=None, a1="", web_session=""):
+            return {"x-s": "", "x-t": ""}
+
+        def warm(self, accounts):
+            warmed.extend(accounts)
+
+    registry = XhsClientRegistry(sign=Signer())
+    client = registry.get("a1=account;webId=account;web_session=session")
+    assert registry.get("a1=account;webId=account;web_session=session") is client
+
+    assert warmed == [("account", "session")]
+
+
+def test_asset_cache_stores_headers_with_body(tmp_path):
+    cache = SignAssetCache(str(tmp_path))
+    url = "https://fe-static.xhscdn.com/sign.js"
+    cache.put(url, b"window._webmsxyw = 1\n", {"access-control-allow-origin": "*"})
+
+    assert cache.get(url) == (b"window._webmsxyw = 1\n", {"access-control-allow-origin": "*"})
+    assert os.listdir(tmp_path) == [os.path.basename(cache._path(url))]
+
+
+def test_asset_cache_ignores_files_without_headers(tmp_path):
+    cache = SignAssetCache(str(tmp_path))
+    url = "https://fe-static.xhscdn.com/sign.js"
+    with open(cache._path(url), "wb") as f:
+        f.write(b"1\nwindow._webmsxyw = 1")
+
+    assert cache.get(url) is None
+
+
+def test_asset_cache_readers_see_matching_headers_and_body(tmp_path):
+    cache = SignAssetCache(str(tmp_path))
+    url = "https://fe-static.xhscdn.com/sign.js"
+
+    def put(i):
+        cache.put(url, f"version {i}".encode("utf-8"), {"etag": str(i)})
+
+    def get(_):
+        cached = cache.get(url)
+        return cached is None or cached[0] == f"version {cached[1]['etag']}".encode("utf-8")
+
+    with ThreadPoolExecutor(8) as executor:
+        writes = [executor.submit(put, i) for i in range(200)]
+        reads = list(executor.map(get, range(200)))
+    for write in writes:
+        write.result()
+    assert all(reads)
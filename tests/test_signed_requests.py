@@ -0,0 +1,113 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.xhs.cache import TTLCache
+from src.xhs.core import XhsClient
+from src.xhs.metrics import InMemoryMetrics
+from src.xhs.ratelimit import RateLimiter
+from src.xhs.sign_strategy import BROWSER, LOCAL, AdaptiveSignStrategy
+
+from .stub_server import QuietHandler, start_stub_server
+from .test_multipart import MemoryCheckpoint
+
+REQUESTS = 400
+WORKERS = 32
+
+
+def fake_signature(uri: str, data=None) -> dict:
+    """签名只取决于 uri 和请求体，服务端据此检查每个请求带的是不是自己的签名"""
+    body = json.dumps(data, separators=(",", ":"), ensure_ascii=False) if isinstance(data, dict) else ""
+    digest = hashlib.md5(f"{uri}{body}".encode("utf-8")).hexdigest()
+    return {"x-s": digest, "x-t": digest[:8], "x-s-common": ""}
+
+
+class SignatureCheckHandler(QuietHandler):
+    def _check(self):
+        body = self.read_body().decode("utf-8")
+        expected = hashlib.md5(f"{self.path}{body}".encode("utf-8")).hexdigest()
+        ok = self.headers.get("x-s") == expected and self.headers.get("x-t") == expected[:8]
+        self.reply(json.dumps({"success": True, "data": {"ok": ok}}).encode("utf-8"),
+                   headers={"Content-Type": "application/json"})
+
+    do_GET = do_POST = _check
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = start_stub_server(SignatureCheckHandler)
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def make_client(host: str, local: bool) -> XhsClient:
+    browser_sign = lambda uri, data=None, a1="", web_session="": fake_signature(uri, data)
+    local_sign = lambda uri, data=None, a1="": fake_signature(uri, data)
+    client = XhsClient(
+        cookie="a1=stress;webId=stress",
+        sign=browser_sign,
+        sign_strategy=AdaptiveSignStrategy(local_sign=local_sign, endpoints=None) if local else None,
+        metrics=InMemoryMetrics(),
+        rate_limiter=RateLimiter(account_rate=(1e6, 1e6, 1e6), egress_rate=(1e6, 1e6, 1e6)),
+    )
+    client._host = host
+    return client
+
+
+@pytest.mark.parametrize("local", [False, True], ids=["browser", "local"])
+def test_parallel_requests_carry_their_own_signature(server, local):
+    client = make_client(server, local)
+
+    def call(i):
+        if i % 2:
+            return client.get("/api/stress/get", {"i": i})
+        return client.post("/api/stress/post", {"i": i, "text": "并发" * (i % 7)})
+
+    with ThreadPoolExecutor(WORKERS) as executor:
+        results = list(executor.map(call, range(REQUESTS)))
+    assert all(result["ok"] for result in results)
+    # 签名只放在单次请求的 headers 里，不能残留在共享的 session 上
+    assert "x-s" not in client.session.headers
+
+
+def test_only_allowlisted_endpoints_use_local_sign():
+    strategy = AdaptiveSignStrategy(local_sign=lambda uri, data=None, a1="": fake_signature(uri, data))
+
+    assert strategy.choose("/web_api/sns/v1/search/topic") == LOCAL
+    assert strategy.choose("/api/media/v1/upload/web/permit?biz_name=spectrum") == LOCAL
+    assert strategy.choose("/api/sns/web/v1/feed") == BROWSER
+    assert not strategy.prefers_local("/api/sns/web/v1/search/notes")
+
+
+def make_note_client(monkeypatch, presigned: list) -> XhsClient:
+    client = XhsClient(cookie="a1=note;webId=note", sign=lambda *args, **kwargs: {}, cache=TTLCache(60))
+    monkeypatch.setattr(client, "presign", presigned.extend)
+    monkeypatch.setattr(client, "search_tags", lambda topics: [{"name": topic} for topic in topics])
+    monkeypatch.setattr(client, "upload_images", lambda files, max_workers=4: [])
+    monkeypatch.setattr(client, "create_note",
+                        lambda *args, **kwargs: {"id": "note", "hash_tags": kwargs["hash_tags"]})
+    return client
+
+
+def test_image_note_presigns_only_uncached_topics(monkeypatch):
+    presigned = []
+    client = make_note_client(monkeypatch, presigned)
+    client.cache.set("topic:cached", {"name": "cached"})
+
+    client.create_image_note("title", "desc", [], topics=["cached", "new"])
+
+    assert presigned == [client._search_tag_request("new")]
+
+
+def test_image_note_skips_presign_for_checkpointed_topics(monkeypatch):
+    presigned = []
+    client = make_note_client(monkeypatch, presigned)
+    checkpoint = MemoryCheckpoint()
+    checkpoint.set("hash_tags", [{"name": "saved"}])
+
+    note = client.create_image_note("title", "desc", [], topics=["new"], checkpoint=checkpoint)
+
+    assert presigned == []
+    assert note["hash_tags"] == [{"name": "saved"}]
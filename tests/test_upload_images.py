@@ -0,0 +1,73 @@
+import hashlib
+import threading
+import time
+from io import BytesIO
+
+import pytest
+
+from src.xhs.core import XhsClient
+from src.xhs.permit import UploadPermit
+from src.xhs.upload_index import UploadDedupIndex
+
+FILES = [f"https://example.com/{i}.jpg" for i in range(6)]
+
+
+class StubPermitPool:
+    def __init__(self):
+        self.count = 0
+
+    def acquire_many(self, count: int) -> list:
+        permits = [UploadPermit(f"file-{self.count + i}", "token", 4102444800) for i in range(count)]
+        self.count += count
+        return permits
+
+
+@pytest.fixture
+def finished():
+    return []
+
+
+@pytest.fixture
+def client(monkeypatch, finished):
+    client = XhsClient(cookie="a1=images;webId=images")
+    pool = StubPermitPool()
+    lock = threading.Lock()
+
+    def load_image(url):
+        return BytesIO(url.encode("utf-8")), hashlib.sha256(url.encode("utf-8")).hexdigest(), 0
+
+    def put_file(file_id, token, data):
+        # 靠前的图片上传得更慢，完成顺序与 files 的顺序相反
+        index = FILES.index(data.getvalue().decode("utf-8"))
+        time.sleep((len(FILES) - index) * 0.01)
+        with lock:
+            finished.append(index)
+
+    monkeypatch.setattr(client, "_load_image", load_image)
+    monkeypatch.setattr(client, "_put_file", put_file)
+    monkeypatch.setattr(client, "permit_pool", lambda file_type: pool)
+    return client
+
+
+def test_results_follow_file_order_when_uploads_finish_out_of_order(client, finished):
+    uploads = client.upload_images(FILES, max_workers=len(FILES))
+
+    assert finished != sorted(finished)
+    assert [uploaded["file_id"] for uploaded in uploads] == [f"file-{i}" for i in range(len(FILES))]
+    assert [uploaded["content_hash"] for uploaded in uploads] == [
+        hashlib.sha256(url.encode("utf-8")).hexdigest() for url in FILES
+    ]
+
+
+def test_reused_images_keep_their_position(client, finished):
+    client.upload_index = UploadDedupIndex()
+    reused_hash = hashlib.sha256(FILES[2].encode("utf-8")).hexdigest()
+    client.remember_uploaded("image", reused_hash, {"file_id": "uploaded-before"})
+
+    uploads = client.upload_images(FILES, max_workers=len(FILES))
+
+    assert [uploaded["reused"] for uploaded in uploads] == [i == 2 for i in range(len(FILES))]
+    assert uploads[2]["file_id"] == "uploaded-before"
+    # 只为没有上传过的图片申请许可，许可按顺序分给各个位置
+    assert [uploaded["file_id"] for i, uploaded in enumerate(uploads) if i != 2] == [f"file-{i}" for i in range(5)]
+    assert 2 not in finished
@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+import src.xhs.core
+from src.xhs.core import XhsClient
+
+PAGE_SIZE = 10
+
+
+class RecordingExecutor(src.xhs.core.ThreadPoolExecutor):
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        RecordingExecutor.instances.append(self)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    RecordingExecutor.instances = []
+    monkeypatch.setattr(src.xhs.core, "ThreadPoolExecutor", RecordingExecutor)
+    client = XhsClient(cookie="a1=notes;webId=notes")
+
+    def get_user_notes(user_id, cursor=""):
+        page = int(cursor or 0)
+        notes = [{"note_id": f"{page}-{i}"} for i in range(PAGE_SIZE)]
+        return {"notes": notes, "has_more": page < 2, "cursor": str(page + 1)}
+
+    monkeypatch.setattr(client, "get_user_notes", get_user_notes)
+    monkeypatch.setattr(client, "_note_from_detail", lambda note: note["note_id"])
+    return client
+
+
+def test_notes_are_yielded_in_page_order(client, monkeypatch):
+    def get_note_by_id(note_id):
+        # 靠前的笔记返回得更慢
+        time.sleep((PAGE_SIZE - int(note_id.split("-")[1])) * 0.002)
+        return {"note_id": note_id}
+
+    monkeypatch.setattr(client, "get_note_by_id", get_note_by_id)
+
+    notes = list(client.iter_user_notes("user", max_workers=4))
+
+    assert notes == [f"{page}-{i}" for page in range(3) for i in range(PAGE_SIZE)]
+
+
+def test_closing_generator_cancels_pending_notes(client, monkeypatch):
+    release = threading.Event()
+    fetched = []
+
+    def get_note_by_id(note_id):
+        fetched.append(note_id)
+        if note_id != "0-0":
+            release.wait(5)
+        return {"note_id": note_id}
+
+    monkeypatch.setattr(client, "get_note_by_id", get_note_by_id)
+
+    notes = client.iter_user_notes("user", max_workers=2)
+    assert next(notes) == "0-0"
+    notes.close()
+    release.set()
+
+    (executor,) = RecordingExecutor.instances
+    assert executor._shutdown
+    for thread in list(executor._threads):
+        thread.join(5)
+    # 只有关闭时已经在执行的请求会完成（max_workers 加上预取分页的一个线程），排队中的笔记不再请求
+    assert len(fetched) <= 1 + 2 + 1
+    assert not any(thread.is_alive() for thread in executor._threads)